@@ -1,14 +1,45 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import base64
+import bisect
+import itertools
 from datetime import datetime
-from io import BytesIO
+from io import BytesIO, StringIO
 import uuid
-from PIL import Image
-from streamlit_js_eval import get_geolocation
+from PIL import Image, features
+from streamlit_js_eval import get_geolocation, streamlit_js_eval
 from streamlit_back_camera_input import back_camera_input
 import json
 import os
+import math
+import copy
+import re
+import hashlib
+import mimetypes
+import shutil
+import tempfile
+import zipfile
+import zlib
+import threading
+import time
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from streamlit.errors import StreamlitAPIException
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; fall back to in-process locking
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Without pyarrow the snapshot data stays inline as JSON
+    pa = None
+    feather = None
 
 # Set page config
 st.set_page_config(page_title="Data Enrichment App", layout="wide")
@@ -95,227 +126,1643 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Constants
+STATE_DIR = "sessions"
+SAVE_FILE_NAME = "app_state.json"
+DATA_FILE_PREFIX = "app_state.data."
+JOURNAL_FILE_NAME = "app_state.journal"
+COMPACTING_JOURNAL_NAME = JOURNAL_FILE_NAME + ".compacting"
+LOCK_FILE_NAME = "app_state.lock"
+JOURNAL_LOCK_FILE_NAME = "app_state.journal.lock"
+META_FILE_NAME = "app_state.meta.json"
+JOURNAL_COMPACT_THRESHOLD = 50
+IMAGE_STORE_DIR = "image_store"
+IMAGE_REF_PREFIX = "imgstore:"
+LOCATION_FIELDS = {
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'accuracy': 'float64',
+    'location_time': 'datetime64[ns, UTC]'
+}
+VIEW_OPTIONS = ["In Progress", "Completed", "All Values", "Nearby"]
+PAGE_SIZE_OPTIONS = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = 25
+IMAGE_WORKER_COUNT = 2
+MAX_PENDING_IMAGE_JOBS = 16
+PENDING_IMAGE_POLL_SECONDS = 1
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_DIR = "exports"
+STATIC_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+STATIC_EXPORT_URL = "app/static/exports"
+EXPORT_MAX_AGE_SECONDS = 3600
+EXPORT_IMAGE_DIR = "images"
+# Streamlit refuses to serve static files larger than this
+STATIC_FILE_SIZE_LIMIT = 200 * 1024 * 1024
+SEARCH_GRAM_SIZE = 3
+SEARCH_RESULT_LIMIT = 500
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_QUALITY = 70
+THUMBNAIL_CACHE_ENTRIES = 500
+FULL_IMAGE_CACHE_ENTRIES = 20
+VALUE_INDEX_CACHE_ENTRIES = 8
+IMAGE_MAX_SIZE = (800, 800)
+IMAGE_QUALITY = 75
+IMAGE_FORMATS = {
+    'JPEG': {'extension': '.jpg', 'mime': 'image/jpeg', 'feature': 'jpg'},
+    'WEBP': {'extension': '.webp', 'mime': 'image/webp', 'feature': 'webp'},
+    'AVIF': {'extension': '.avif', 'mime': 'image/avif', 'feature': 'avif'}
+}
+IMAGE_PROFILES = {
+    'standard': {'label': "Standard JPEG (800px)", 'format': 'JPEG', 'max_size': IMAGE_MAX_SIZE,
+                 'quality': IMAGE_QUALITY, 'resample': 'lanczos'},
+    'fast': {'label': "Fast JPEG (800px, quicker resize)", 'format': 'JPEG', 'max_size': IMAGE_MAX_SIZE,
+             'quality': IMAGE_QUALITY, 'resample': 'fast'},
+    'webp': {'label': "Compact WebP (800px)", 'format': 'WEBP', 'max_size': IMAGE_MAX_SIZE,
+             'quality': 70, 'resample': 'fast'},
+    'webp_50kb': {'label': "WebP under 50 KB (800px)", 'format': 'WEBP', 'max_size': IMAGE_MAX_SIZE,
+                  'quality': 85, 'target_bytes': 50_000, 'resample': 'fast'},
+    'avif': {'label': "Compact AVIF (800px)", 'format': 'AVIF', 'max_size': IMAGE_MAX_SIZE,
+             'quality': 55, 'resample': 'fast'},
+    'detailed': {'label': "Detailed JPEG (1600px)", 'format': 'JPEG', 'max_size': (1600, 1600),
+                 'quality': 85, 'resample': 'lanczos'}
+}
+DEFAULT_IMAGE_PROFILE = 'standard'
+IMAGE_TARGET_MIN_QUALITY = 30
+BROWSER_UPLOAD_QUALITY = 90
+PREVIEW_SIZE = (640, 640)
+PREVIEW_QUALITY = 80
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = 111320
+SPATIAL_CELL_DEGREES = 0.01
+SPATIAL_CELL_COLUMNS = round(360 / SPATIAL_CELL_DEGREES)
+NEARBY_DEFAULT_RADIUS_M = 500
+NEARBY_DEFAULT_K = 10
+DUPLICATE_RADIUS_M = 5
+DUPLICATE_BLOCK_ROWS = 1024
+UPLOAD_DIR = "uploads"
+INGEST_CHUNK_ROWS = 50000
+PREVIEW_ROWS = 5
+TIMING_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+TIMING_SAMPLE_LIMIT = 5000
+OFFLINE_QUEUE_PREFIX = "enrichment_queue_"
+OFFLINE_SYNC_BATCH = 20
+CLIENT_PHOTO_MAX_SIZE = 800
+CLIENT_PHOTO_QUALITY = 0.8
+
+DEFAULT_TARGET_ID = "main"
+TARGETS_DIR_NAME = "targets"
+
+# State kept separately for each enrichment target (a dataset and the column being enriched)
+TARGET_STATE_DEFAULTS = {
+    'data': None,
+    'data_name': None,
+    'selected_column': None,
+    'progress': {},
+    'location_columns': None,
+    'image_column': None,
+    'camera_active': {},
+    'search_term': "",
+    'open_expanders': set(),
+    'value_index': None,
+    'journal_records': 0,
+    'page': {},
+    'pending_images': {},
+    'source_path': None,
+    'source_row_count': None,
+    'data_fingerprint': None,
+    'image_profile': DEFAULT_IMAGE_PROFILE,
+    'progress_stats': None,
+    'search_index': None,
+    'spatial_index': None,
+    'offline_sync': None,
+    'offline_sync_result': None,
+    'offline_move': None
+}
+
+# Stored images are served and exported with the MIME type of their extension
+for image_format in IMAGE_FORMATS.values():
+    mimetypes.add_type(image_format['mime'], image_format['extension'])
+
 # Session state initialization
-if 'data' not in st.session_state:
-    st.session_state.data = None
-if 'selected_column' not in st.session_state:
-    st.session_state.selected_column = None
-if 'progress' not in st.session_state:
-    st.session_state.progress = {}
-if 'location_column' not in st.session_state:
-    st.session_state.location_column = None
-if 'image_column' not in st.session_state:
-    st.session_state.image_column = None
-if 'camera_active' not in st.session_state:
-    st.session_state.camera_active = {}
-if 'search_term' not in st.session_state:
-    st.session_state.search_term = ""
+if 'session_id' not in st.session_state:
+    # Saved state is keyed by a per-session id kept in the URL so a reload can restore it
+    session_id = st.query_params.get("session", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_id
+    st.session_state.session_id = session_id
+if 'active_target' not in st.session_state:
+    # The target being worked on is kept in the URL too, so a reload returns to it
+    target_id = st.query_params.get("target", DEFAULT_TARGET_ID)
+    if not re.fullmatch(r"[0-9a-f]{32}", target_id):
+        target_id = DEFAULT_TARGET_ID
+    st.session_state.active_target = target_id
+if 'targets' not in st.session_state:
+    st.session_state.targets = None
+for key, default in TARGET_STATE_DEFAULTS.items():
+    if key not in st.session_state:
+        st.session_state[key] = copy.deepcopy(default)
 if 'active_capture_value' not in st.session_state:
     st.session_state.active_capture_value = None
 if 'location_requested' not in st.session_state:
     st.session_state.location_requested = {}
 if 'temp_photo' not in st.session_state:
     st.session_state.temp_photo = None
-if 'open_expanders' not in st.session_state:
-    st.session_state.open_expanders = set()
+if 'temp_preview' not in st.session_state:
+    st.session_state.temp_preview = None
+if 'capture_round' not in st.session_state:
+    st.session_state.capture_round = 0
 if 'location_saved' not in st.session_state:
     st.session_state.location_saved = False
+if 'page_size' not in st.session_state:
+    st.session_state.page_size = DEFAULT_PAGE_SIZE
+if 'batch_location_requested' not in st.session_state:
+    st.session_state.batch_location_requested = False
+if 'batch_location_saved' not in st.session_state:
+    st.session_state.batch_location_saved = 0
+if 'batch_location_round' not in st.session_state:
+    st.session_state.batch_location_round = 0
+if 'timings' not in st.session_state:
+    st.session_state.timings = {'stats': {}, 'samples': deque(maxlen=TIMING_SAMPLE_LIMIT)}
+if 'current_phase' not in st.session_state:
+    st.session_state.current_phase = None
 
-# Constants
-SAVE_FILE_PATH = "app_state.json"
+# Timing instrumentation is opt-in by adding ?debug=1 to the page address
+st.session_state.timings_enabled = st.query_params.get("debug") == "1"
+
+# Function to record one timing sample for the debug panel
+def record_timing(name, seconds, payload_bytes=None):
+    """Add a sample to the per-session histogram and sample log for name"""
+    timings = st.session_state.timings
+    stats = timings['stats'].setdefault(name, {
+        'count': 0,
+        'total': 0.0,
+        'max': 0.0,
+        'payload_bytes': 0,
+        'buckets': [0] * (len(TIMING_BUCKETS_MS) + 1)
+    })
+    ms = seconds * 1000
+    stats['count'] += 1
+    stats['total'] += seconds
+    stats['max'] = max(stats['max'], seconds)
+    stats['buckets'][bisect.bisect_left(TIMING_BUCKETS_MS, ms)] += 1
+    if payload_bytes is not None:
+        stats['payload_bytes'] += payload_bytes
+    timings['samples'].append({
+        'session_id': st.session_state.session_id,
+        'name': name,
+        'ms': round(ms, 3),
+        'bytes': payload_bytes,
+        'timestamp': datetime.now().isoformat()
+    })
+
+# Time a block of code when instrumentation is on
+@contextmanager
+def timed(name, payload_bytes=None):
+    if not st.session_state.timings_enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start, payload_bytes)
+
+# Decorator to time every call of a helper when instrumentation is on
+def instrumented(payload=None):
+    """payload(*args, **kwargs) returns the size in bytes recorded with each call"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not st.session_state.timings_enabled:
+                return func(*args, **kwargs)
+            with timed(func.__name__, payload(*args, **kwargs) if payload else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Function to end the running phase of main() and start timing the next one
+def mark_phase(name=None):
+    # Start Over empties the session state before its rerun
+    if not st.session_state.get('timings_enabled'):
+        return
+    now = time.perf_counter()
+    if st.session_state.current_phase is not None:
+        phase, start = st.session_state.current_phase
+        record_timing(f"main: {phase}", now - start)
+    st.session_state.current_phase = None if name is None else (name, now)
+
+# Thread locks per session state directory; file locks cover other processes
+_state_locks = {}
+_state_locks_guard = threading.Lock()
+
+# Function to get the state directory of an enrichment target
+def get_target_dir(target_id=None):
+    """The first target keeps the session directory itself, so older saved sessions still restore"""
+    target_id = target_id or st.session_state.active_target
+    session_dir = os.path.join(STATE_DIR, st.session_state.session_id)
+    if target_id == DEFAULT_TARGET_ID:
+        return session_dir
+    return os.path.join(session_dir, TARGETS_DIR_NAME, target_id)
+
+# Function to get the path of a file in a target's state directory
+def get_state_path(name, target_id=None):
+    return os.path.join(get_target_dir(target_id), name)
+
+# Function to lock a session state directory
+def acquire_state_lock(state_dir, blocking=True, lock_name=LOCK_FILE_NAME):
+    """Take the thread and file lock lock_name for state_dir, returning a handle or None"""
+    with _state_locks_guard:
+        thread_lock = _state_locks.setdefault((state_dir, lock_name), threading.Lock())
+    if not thread_lock.acquire(blocking=blocking):
+        return None
+    
+    lock_file = None
+    try:
+        os.makedirs(state_dir, exist_ok=True)
+        lock_file = open(os.path.join(state_dir, lock_name), 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except Exception:
+        if lock_file is not None:
+            lock_file.close()
+        thread_lock.release()
+        if blocking:
+            raise
+        return None
+    return thread_lock, lock_file
+
+# Function to release a session state directory lock
+def release_state_lock(handle):
+    thread_lock, lock_file = handle
+    # Closing the file drops the file lock
+    lock_file.close()
+    thread_lock.release()
+
+# Context manager holding this session's state lock
+@contextmanager
+def state_lock(target_id=None, lock_name=LOCK_FILE_NAME):
+    """The snapshot lock covers the snapshot files; the journal lock, always taken second, covers the journal"""
+    handle = acquire_state_lock(get_target_dir(target_id), lock_name=lock_name)
+    try:
+        yield
+    finally:
+        release_state_lock(handle)
+
+# Function to build the state object written to the snapshot
+def build_state_snapshot():
+    """Collect the non-data session state stored alongside the snapshot"""
+    return {
+        'data_name': st.session_state.data_name,
+        'selected_column': st.session_state.selected_column,
+        'location_columns': st.session_state.location_columns,
+        'image_column': st.session_state.image_column,
+        'source_path': st.session_state.source_path,
+        'source_row_count': st.session_state.source_row_count,
+        'data_fingerprint': st.session_state.data_fingerprint,
+        'image_profile': st.session_state.image_profile,
+        # Flags are replaced rather than mutated, so copying the outer dict snapshots them
+        'progress': dict(st.session_state.progress),
+        'timestamp': datetime.now().isoformat()
+    }
+
+# Function to write the snapshot data as an Arrow IPC (Feather) file
+def write_state_data(data, path):
+    """Durably write data uncompressed so restores can memory-map it"""
+    try:
+        feather.write_feather(data, path, compression='uncompressed')
+        with open(path, 'rb') as f:
+            os.fsync(f.fileno())
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+# Function to read the snapshot data back from an Arrow IPC (Feather) file
+def read_state_data(path):
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+# Function to remove snapshot data files no longer referenced by the snapshot
+def remove_stale_data_files(state_dir, keep=None):
+    for name in os.listdir(state_dir):
+        if name.startswith(DATA_FILE_PREFIX) and name != keep:
+            os.remove(os.path.join(state_dir, name))
+
+# Function to write a snapshot file atomically
+def write_state_snapshot(state, data, path):
+    """Write data beside the snapshot file, or inline as JSON, and atomically replace it"""
+    state_dir = os.path.dirname(path)
+    if feather is not None:
+        # Each snapshot gets its own data file, so the old snapshot stays whole until replaced
+        data_file = f"{DATA_FILE_PREFIX}{uuid.uuid4().hex}.arrow"
+        try:
+            write_state_data(data, os.path.join(state_dir, data_file))
+            state['data_file'] = data_file
+        except (pa.ArrowException, ValueError):
+            # Columns Arrow cannot type (such as mixed objects) fall back to JSON
+            pass
+    if 'data_file' not in state:
+        state['data'] = data.to_json(date_format='iso')
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    
+    remove_stale_data_files(state_dir, keep=state.get('data_file'))
+
+# Function to build the small metadata record kept beside the snapshot
+def build_state_metadata():
+    """Summarize the session for the restore prompt without the data itself"""
+    stats = get_progress_stats() if st.session_state.selected_column is not None else None
+    # Large file mode holds only a preview or the unique values, so count the file's rows instead
+    if st.session_state.source_path is not None:
+        row_count = st.session_state.source_row_count
+    else:
+        row_count = len(st.session_state.data)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'row_count': row_count,
+        'columns': list(st.session_state.data.columns),
+        'data_name': st.session_state.data_name,
+        'selected_column': st.session_state.selected_column,
+        'value_count': len(stats['values']) if stats else 0,
+        'location_count': stats['location_count'] if stats else 0,
+        'image_count': stats['image_count'] if stats else 0,
+        'completed_count': len(stats['completed_positions']) if stats else 0
+    }
+
+# Function to write the metadata sidecar atomically
+def write_state_metadata():
+    path = get_state_path(META_FILE_NAME)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(build_state_metadata(), f)
+    os.replace(tmp_path, path)
 
 # Function to save app state to file
+@instrumented()
 def save_app_state():
-    """Save current app state to file"""
+    """Save a full snapshot of the current app state and reset the journal"""
     if st.session_state.data is not None:
         try:
-            # Convert dataframe to JSON
-            data_json = st.session_state.data.to_json()
-            
-            # Create state object
-            state = {
-                'data': data_json,
-                'selected_column': st.session_state.selected_column,
-                'location_column': st.session_state.location_column,
-                'image_column': st.session_state.image_column,
-                'progress': st.session_state.progress,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Save to file
-            with open(SAVE_FILE_PATH, 'w') as f:
-                json.dump(state, f)
+            with state_lock(), state_lock(lock_name=JOURNAL_LOCK_FILE_NAME):
+                write_state_snapshot(build_state_snapshot(), st.session_state.data, get_state_path(SAVE_FILE_NAME))
+                write_state_metadata()
+                
+                # The snapshot now holds every edit, so the journal can go
+                for name in (JOURNAL_FILE_NAME, COMPACTING_JOURNAL_NAME):
+                    if os.path.exists(get_state_path(name)):
+                        os.remove(get_state_path(name))
+                st.session_state.journal_records = 0
             return True
         except Exception as e:
             st.error(f"Error saving state: {e}")
             return False
     return False
 
+# Function to append a single edit to the journal
+def append_journal(value, field, column, payload):
+    """Durably append one edit record to the journal"""
+    return append_journal_records([{
+        'value': value,
+        'field': field,
+        'column': column,
+        'payload': payload,
+        'timestamp': datetime.now().isoformat()
+    }])
+
+# Function to append several edits to the journal with a single fsync
+def append_journal_records(records):
+    """Durably append edit records to the journal, compacting when it grows"""
+    try:
+        # Only the journal lock, so appends do not wait on a compaction writing its snapshot
+        with state_lock(lock_name=JOURNAL_LOCK_FILE_NAME):
+            with open(get_state_path(JOURNAL_FILE_NAME), 'a') as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            write_state_metadata()
+        st.session_state.journal_records += len(records)
+        
+        if st.session_state.journal_records >= JOURNAL_COMPACT_THRESHOLD:
+            compact_app_state()
+        return True
+    except Exception as e:
+        st.error(f"Error saving state: {e}")
+        return False
+
+# Function to compact the journal into a new snapshot in the background
+def compact_app_state():
+    """Fold the journal into a fresh snapshot written on a background thread"""
+    save_path = get_state_path(SAVE_FILE_NAME)
+    journal_path = get_state_path(JOURNAL_FILE_NAME)
+    compacting_path = get_state_path(COMPACTING_JOURNAL_NAME)
+    
+    # Skip if a previous compaction is still writing; the journal keeps growing
+    handle = acquire_state_lock(os.path.dirname(save_path), blocking=False)
+    if handle is None:
+        return False
+    
+    try:
+        # Rotate the journal so new edits go to a fresh file while we compact
+        with state_lock(lock_name=JOURNAL_LOCK_FILE_NAME):
+            if os.path.exists(journal_path):
+                if os.path.exists(compacting_path):
+                    # A previous compaction failed; keep its records ahead of ours
+                    with open(journal_path, 'rb') as src, open(compacting_path, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    os.remove(journal_path)
+                else:
+                    os.replace(journal_path, compacting_path)
+        st.session_state.journal_records = 0
+        
+        state = build_state_snapshot()
+        data = st.session_state.data.copy()
+    except Exception:
+        release_state_lock(handle)
+        raise
+    
+    def run():
+        try:
+            write_state_snapshot(state, data, save_path)
+            os.remove(compacting_path)
+        except Exception:
+            # The rotated journal stays on disk and is replayed on load
+            pass
+        finally:
+            release_state_lock(handle)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+# Function to apply a journal record to the loaded state
+def apply_journal_record(record):
+    """Replay one journal record onto the session data and progress"""
+    value = record['value']
+    field = record['field']
+    column = record['column']
+    rows = get_value_rows(value)
+    
+    if field == 'location':
+        payload = record['payload']
+        if isinstance(payload, str):
+            # Records written before locations were split into typed columns
+            payload = parse_location_text(payload)
+        if payload is not None and len(rows) > 0:
+            write_location(rows, payload)
+    elif field == 'image':
+        st.session_state.image_column = column
+        if column not in st.session_state.data.columns:
+            st.session_state.data[column] = None
+        if len(rows) > 0:
+            st.session_state.data.iloc[rows, st.session_state.data.columns.get_loc(column)] = record['payload']
+    else:
+        return
+    
+    if len(rows) > 0:
+        progress = st.session_state.progress.get(value, {'location': False, 'image': False})
+        st.session_state.progress[value] = {**progress, field: True}
+
+# Function to replay a journal file
+def replay_journal(path):
+    """Replay every complete record in a journal file, returning the count"""
+    count = 0
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final write from a crash; everything before it is intact
+                    break
+                apply_journal_record(record)
+                count += 1
+    return count
+
 # Function to load app state from file
+@instrumented()
 def load_app_state():
-    """Load app state from file"""
+    """Load the app state snapshot and replay the journal on top of it"""
     try:
-        if os.path.exists(SAVE_FILE_PATH):
-            with open(SAVE_FILE_PATH, 'r') as f:
-                state = json.load(f)
+        if saved_state_exists():
+            with state_lock(), state_lock(lock_name=JOURNAL_LOCK_FILE_NAME):
+                with open(get_state_path(SAVE_FILE_NAME), 'r') as f:
+                    state = json.load(f)
                 
-                if 'data' in state:
+                if 'data_file' in state or 'data' in state:
                     # Restore dataframe
-                    st.session_state.data = pd.read_json(state['data'])
+                    if 'data_file' in state:
+                        st.session_state.data = read_state_data(get_state_path(state['data_file']))
+                    else:
+                        # Keep values as written so numeric-looking IDs stay strings
+                        st.session_state.data = pd.read_json(StringIO(state['data']), dtype=False, convert_dates=False)
                     
                     # Restore other session state variables
+                    st.session_state.data_name = state.get('data_name')
                     st.session_state.selected_column = state['selected_column']
-                    st.session_state.location_column = state['location_column']
+                    st.session_state.location_columns = state.get('location_columns')
                     st.session_state.image_column = state['image_column']
+                    st.session_state.source_path = state.get('source_path')
+                    st.session_state.source_row_count = state.get('source_row_count')
+                    st.session_state.data_fingerprint = state.get('data_fingerprint')
+                    st.session_state.image_profile = state.get('image_profile', DEFAULT_IMAGE_PROFILE)
                     st.session_state.progress = state['progress']
                     
+                    # Restore column dtypes JSON does not carry, and upgrade "lat, lng" text columns
+                    if st.session_state.location_columns is not None:
+                        ensure_location_columns()
+                    elif state.get('location_column') in st.session_state.data.columns:
+                        migrate_location_text_column(state['location_column'])
+                    
+                    # Rebuild the value lookup index for the restored data
+                    st.session_state.value_index = None
+                    if st.session_state.selected_column is not None:
+                        build_value_index()
+                        
+                        # Replay edits made since the snapshot, oldest first
+                        st.session_state.journal_records = (
+                            replay_journal(get_state_path(COMPACTING_JOURNAL_NAME))
+                            + replay_journal(get_state_path(JOURNAL_FILE_NAME))
+                        )
+                    
+                    st.session_state.progress_stats = None
+                    
                     return True
     except Exception as e:
         st.error(f"Error loading saved state: {e}")
     return False
 
 # Function to check if a saved state exists
-def saved_state_exists():
+def saved_state_exists(target_id=None):
     """Check if a saved state exists"""
-    return os.path.exists(SAVE_FILE_PATH)
+    return os.path.exists(get_state_path(SAVE_FILE_NAME, target_id))
+
+# Function to read the saved state metadata sidecar
+def get_saved_state_metadata(target_id=None):
+    """Read the small metadata sidecar without touching the snapshot"""
+    try:
+        with open(get_state_path(META_FILE_NAME, target_id), 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
 
 # Function to get saved state timestamp
 def get_saved_state_timestamp():
     """Get the timestamp of the saved state"""
     try:
-        if saved_state_exists():
-            with open(SAVE_FILE_PATH, 'r') as f:
-                state = json.load(f)
-                if 'timestamp' in state:
-                    return datetime.fromisoformat(state['timestamp']).strftime("%Y-%m-%d %H:%M:%S")
+        metadata = get_saved_state_metadata()
+        if metadata is None and saved_state_exists():
+            # Older saves have no sidecar, so fall back to the snapshot itself
+            with open(get_state_path(SAVE_FILE_NAME), 'r') as f:
+                metadata = json.load(f)
+        if metadata and 'timestamp' in metadata:
+            return datetime.fromisoformat(metadata['timestamp']).strftime("%Y-%m-%d %H:%M:%S")
     except Exception:
         pass
     return None
 
 # Function to clear saved state
-def clear_saved_state():
-    """Clear saved state file"""
-    if saved_state_exists():
-        try:
-            os.remove(SAVE_FILE_PATH)
-            return True
-        except Exception:
-            return False
-    return True
+def clear_saved_state(target_id=None):
+    """Clear saved state snapshot and journal files"""
+    try:
+        with state_lock(target_id), state_lock(target_id, JOURNAL_LOCK_FILE_NAME):
+            for name in (SAVE_FILE_NAME, META_FILE_NAME, JOURNAL_FILE_NAME, COMPACTING_JOURNAL_NAME):
+                if os.path.exists(get_state_path(name, target_id)):
+                    os.remove(get_state_path(name, target_id))
+            remove_stale_data_files(get_target_dir(target_id))
+        return True
+    except Exception:
+        return False
 
-# Function to compress and encode image to base64
-def compress_and_encode_image(image_data, max_size=(800, 800), quality=75):
+# Function to make an id for a new enrichment target
+def new_target_id():
+    """A millisecond timestamp prefix keeps target ids in creation order"""
+    return f"{time.time_ns() // 1_000_000:012x}{uuid.uuid4().hex[:20]}"
+
+# Function to get the session's enrichment targets, finding saved ones on first use
+def get_targets():
+    """Map each target id to its parked state, or None while it is active or still only on disk"""
+    if st.session_state.targets is None:
+        targets = {DEFAULT_TARGET_ID: None}
+        targets_dir = os.path.join(STATE_DIR, st.session_state.session_id, TARGETS_DIR_NAME)
+        if os.path.isdir(targets_dir):
+            for target_id in sorted(os.listdir(targets_dir)):
+                if saved_state_exists(target_id):
+                    targets[target_id] = None
+        st.session_state.targets = targets
+    st.session_state.targets.setdefault(st.session_state.active_target, None)
+    return st.session_state.targets
+
+# Function to describe a target by its dataset and column
+def get_target_label(target_id):
+    if target_id == st.session_state.active_target and st.session_state.data is not None:
+        info = {'data_name': st.session_state.data_name, 'selected_column': st.session_state.selected_column}
+    else:
+        # Targets not opened yet are described from their metadata sidecar
+        info = get_targets().get(target_id) or get_saved_state_metadata(target_id) or {}
+    return f"{info.get('data_name') or 'Untitled dataset'} › {info.get('selected_column') or 'no column yet'}"
+
+# Function to make another enrichment target the active one
+def switch_target(target_id):
+    """Park the active target's state in memory and bring back target_id's, loading it from disk the first time"""
+    targets = get_targets()
+    targets[st.session_state.active_target] = {key: st.session_state[key] for key in TARGET_STATE_DEFAULTS}
+    parked = targets.get(target_id)
+    for key, default in TARGET_STATE_DEFAULTS.items():
+        st.session_state[key] = parked[key] if parked is not None else copy.deepcopy(default)
+    targets[target_id] = None
+    
+    st.session_state.active_target = target_id
+    if target_id == DEFAULT_TARGET_ID:
+        st.query_params.pop("target", None)
+    else:
+        st.query_params["target"] = target_id
+    
+    # A capture in progress belongs to the target being left
+    st.session_state.active_capture_value = None
+    st.session_state.temp_photo = None
+    st.session_state.location_requested = {}
+    st.session_state.batch_location_requested = False
+    
+    if parked is None and saved_state_exists():
+        load_app_state()
+
+# Function to start a new enrichment target
+def add_target(same_dataset=False):
+    """Start an empty target, or one that enriches another column of the active dataset"""
+    dataset = {key: st.session_state[key] for key in ('data', 'data_name', 'source_path', 'source_row_count', 'data_fingerprint', 'image_profile')}
+    if same_dataset:
+        if dataset['source_path'] is not None:
+            # Large file mode holds only the enriched column, so preview the file for the next one
+            dataset['data'] = pd.read_csv(dataset['source_path'], nrows=PREVIEW_ROWS)
+        else:
+            # Copy-on-write shares the rows with the active target instead of copying them
+            dataset['data'] = dataset['data'].drop(columns=get_enrichment_columns())
+    
+    switch_target(new_target_id())
+    if same_dataset:
+        for key, value in dataset.items():
+            st.session_state[key] = value
+        save_app_state()
+
+# Function to get a cache key for the contents of a data column
+def get_column_fingerprint(column):
+    """Use the uploaded file's hash, or hash the column when the upload is unknown"""
+    if st.session_state.data_fingerprint is not None:
+        # Large file mode indexes a frame of unique values rather than every row of the same file
+        mode = "source" if st.session_state.source_path is not None else "full"
+        return f"{st.session_state.data_fingerprint}:{mode}:{len(st.session_state.data)}"
+    hashed = pd.util.hash_pandas_object(st.session_state.data[column], index=False)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()
+
+# Function to extract the unique values of a column, cached per dataset and column
+@st.cache_data(max_entries=VALUE_INDEX_CACHE_ENTRIES, show_spinner=False)
+def extract_column_values(_series, fingerprint, column):
+    """Stringify the column once and group its row positions by value in first-occurrence order"""
+    # Newer pandas keeps missing cells missing through astype(str), so name them as older versions did
+    codes, uniques = pd.factorize(_series.astype(str).fillna('nan'))
+    # A stable sort keeps each value's rows in order, so its first row leads its group
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {'values': uniques.tolist(), 'order': order, 'bounds': bounds}
+
+# Function to build the value to row positions index
+@instrumented()
+def build_value_index():
+    """Index the row positions of every value in the selected column"""
+    column = st.session_state.selected_column
+    index = extract_column_values(st.session_state.data[column], get_column_fingerprint(column), column)
+    index['column'] = column
+    index['positions'] = {value: i for i, value in enumerate(index['values'])}
+    index['first_rows'] = index['order'][index['bounds'][:-1]]
+    st.session_state.value_index = index
+    return index
+
+# Function to get the value index, rebuilding it if stale
+def get_value_index():
+    index = st.session_state.value_index
+    if index is None or index['column'] != st.session_state.selected_column:
+        return build_value_index()
+    return index
+
+# Function to get the row positions for a value
+def get_value_rows(value):
+    """Get the row positions holding value, rebuilding the index if stale"""
+    index = get_value_index()
+    i = index['positions'].get(str(value))
+    if i is None:
+        return []
+    return index['order'][index['bounds'][i]:index['bounds'][i + 1]]
+
+# Function to read a column for the first row holding a value
+def get_value_field(value, column):
+    """Get the cell in column for the first row holding value"""
+    rows = get_value_rows(value)
+    if column is None or column not in st.session_state.data.columns or len(rows) == 0:
+        return None
+    return st.session_state.data.iat[rows[0], st.session_state.data.columns.get_loc(column)]
+
+# Function to rebuild the progress aggregates from scratch
+def rebuild_progress_stats():
+    """Recompute in-progress/completed sets and counters for the selected column"""
+    index = get_value_index()
+    values = index['values']
+    stats = {
+        'values': values,
+        'positions': index['positions'],
+        'in_progress': {},
+        'completed_positions': [],
+        'location_count': 0,
+        'image_count': 0
+    }
+    all_progress = st.session_state.progress
+    for i, value in enumerate(values):
+        progress = all_progress.get(value, {})
+        stats['location_count'] += bool(progress.get('location'))
+        stats['image_count'] += bool(progress.get('image'))
+        if progress.get('location') and progress.get('image'):
+            stats['completed_positions'].append(i)
+        else:
+            stats['in_progress'][value] = None
+    st.session_state.progress_stats = stats
+    return stats
+
+# Function to get the progress aggregates, building them if needed
+def get_progress_stats():
+    if st.session_state.progress_stats is None:
+        return rebuild_progress_stats()
+    return st.session_state.progress_stats
+
+# Function to mark a field as captured and update the aggregates incrementally
+def mark_progress(value, field):
+    stats = get_progress_stats()
+    progress = st.session_state.progress.get(value, {'location': False, 'image': False})
+    if progress[field]:
+        return
+    # Replace the flags instead of mutating them, so snapshots already taken stay unchanged
+    progress = st.session_state.progress[value] = {**progress, field: True}
+    
+    stats[f'{field}_count'] += 1
+    if progress['location'] and progress['image'] and value in stats['in_progress']:
+        # Move the value across while keeping the completed list in column order
+        del stats['in_progress'][value]
+        bisect.insort(stats['completed_positions'], stats['positions'][value])
+
+# Function to list the encoding profiles this Pillow build can write
+def get_available_image_profiles():
+    return [name for name, profile in IMAGE_PROFILES.items()
+            if features.check(IMAGE_FORMATS[profile['format']]['feature'])]
+
+# Function to get the encoding profile chosen for the current dataset
+def get_image_profile(name=None):
+    """Fall back to the default profile when the chosen one is unknown or unsupported here"""
+    name = name or st.session_state.image_profile
+    if name not in get_available_image_profiles():
+        name = DEFAULT_IMAGE_PROFILE
+    return IMAGE_PROFILES[name]
+
+# Function to get the image store extension for a profile's output format
+def get_image_extension(profile):
+    return IMAGE_FORMATS[profile['format']]['extension']
+
+# Function to check whether an opened image already meets a profile
+def fits_image_profile(img, size_bytes, profile):
+    max_size = profile['max_size']
+    return (img.format == profile['format']
+            and img.width <= max_size[0] and img.height <= max_size[1]
+            and size_bytes <= profile.get('target_bytes', size_bytes))
+
+# Function to write a PIL image in the given format
+def write_image_bytes(img, image_format, quality):
+    output = BytesIO()
+    img.save(output, format=image_format, quality=quality)
+    return output.getvalue()
+
+# Function to find the highest quality that fits the profile's target size
+def encode_to_target_bytes(img, profile):
+    """Binary search the quality setting, settling for the lowest one if nothing fits"""
+    # Most photos fit at the profile's own quality, which needs just the one encode
+    best = write_image_bytes(img, profile['format'], profile['quality'])
+    if len(best) <= profile['target_bytes']:
+        return best
+    
+    low, high = IMAGE_TARGET_MIN_QUALITY, profile['quality'] - 1
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        encoded = write_image_bytes(img, profile['format'], quality)
+        if len(encoded) <= profile['target_bytes']:
+            best = encoded
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best if best is not None else write_image_bytes(img, profile['format'], IMAGE_TARGET_MIN_QUALITY)
+
+# Function to encode an image with an encoding profile, raising on failure
+def encode_image(image_data, profile=None):
+    """Resize and re-encode the image, or return it untouched if it already meets the profile"""
+    profile = profile or IMAGE_PROFILES[DEFAULT_IMAGE_PROFILE]
+    max_size = profile['max_size']
+    
+    # Open the image
+    img = Image.open(BytesIO(image_data))
+    if fits_image_profile(img, len(image_data), profile):
+        return image_data
+    
+    resample = Image.LANCZOS
+    if profile['resample'] == 'fast':
+        # JPEGs decode straight at 1/2, 1/4 or 1/8 scale, leaving a small bilinear resize
+        img.draft('RGB', max_size)
+        resample = Image.BILINEAR
+    
+    # Convert RGBA to RGB if needed
+    if img.mode == 'RGBA':
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(img, mask=img.split()[3])  # Use alpha channel as mask
+        img = rgb_img
+    elif img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    
+    # Resize if larger than max_size
+    if img.width > max_size[0] or img.height > max_size[1]:
+        img.thumbnail(max_size, resample)
+    
+    if 'target_bytes' in profile:
+        return encode_to_target_bytes(img, profile)
+    return write_image_bytes(img, profile['format'], profile['quality'])
+
+# Function to compress an image with the dataset's encoding profile
+@instrumented(payload=lambda image_data, *args, **kwargs: len(image_data))
+def compress_image(image_data, profile=None):
     try:
-        # Open the image
-        img = Image.open(BytesIO(image_data))
-        
-        # Convert RGBA to RGB if needed
-        if img.mode == 'RGBA':
-            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-            rgb_img.paste(img, mask=img.split()[3])  # Use alpha channel as mask
-            img = rgb_img
-        
-        # Resize if larger than max_size
-        if img.width > max_size[0] or img.height > max_size[1]:
-            img.thumbnail(max_size, Image.LANCZOS)
-        
-        # Save to BytesIO with compression
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality)
-        output.seek(0)
-        
-        # Encode to base64
-        encoded = base64.b64encode(output.getvalue()).decode('utf-8')
-        return f"data:image/jpeg;base64,{encoded}"
+        return encode_image(image_data, profile or get_image_profile())
     except Exception as e:
         st.error(f"Error compressing image: {e}")
         return None
 
-# Function to generate a download link for the CSV
-def get_csv_download_link(df):
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"enriched_data_{timestamp}.csv"
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}" class="big-camera-button">Download Enriched CSV</a>'
-    return href
+# Function to compress and encode image to base64
+@instrumented(payload=lambda image_data, *args, **kwargs: len(image_data))
+def compress_and_encode_image(image_data, profile=None):
+    profile = profile or get_image_profile()
+    image_bytes = compress_image(image_data, profile)
+    if image_bytes is None:
+        return None
+    
+    # Encode to base64
+    encoded = base64.b64encode(image_bytes).decode('utf-8')
+    return f"data:{IMAGE_FORMATS[profile['format']]['mime']};base64,{encoded}"
+
+# Function to store image bytes in the content-addressed image store
+def store_image(image_bytes, extension=".jpg"):
+    """Write image bytes under their content hash and return the reference"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    ref = f"{IMAGE_REF_PREFIX}{digest}{extension}"
+    path = get_image_path(ref)
+    
+    # Identical captures hash to the same file, so each is stored once
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(image_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    return ref
+
+# Function to check whether a cell holds an image store reference
+def is_image_ref(value):
+    return isinstance(value, str) and value.startswith(IMAGE_REF_PREFIX)
+
+# Function to get the file path for an image store reference
+def get_image_path(ref):
+    name = ref[len(IMAGE_REF_PREFIX):]
+    return os.path.join(IMAGE_STORE_DIR, name[:2], name)
+
+# Function to read the image bytes behind a cell value
+def load_image_bytes(value):
+    """Read image bytes from a store reference or a legacy base64 data URI"""
+    try:
+        if is_image_ref(value):
+            with open(get_image_path(value), 'rb') as f:
+                return f.read()
+        if isinstance(value, str) and value.startswith('data:image'):
+            return base64.b64decode(value.split(',', 1)[1])
+    except Exception:
+        pass
+    return None
+
+# Function to store an uploaded CSV on disk for large file mode
+def save_uploaded_source(uploaded_file):
+    """Copy the upload to UPLOAD_DIR in chunks, named by its content hash"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    with open(tmp_path, 'wb') as f:
+        for block in iter(lambda: uploaded_file.read(1024 * 1024), b''):
+            digest.update(block)
+            f.write(block)
+    path = os.path.join(UPLOAD_DIR, f"{digest.hexdigest()}.csv")
+    os.replace(tmp_path, path)
+    return path
+
+# Function to read the unique values of one column of a large CSV
+@st.cache_data(max_entries=VALUE_INDEX_CACHE_ENTRIES, show_spinner=False)
+def load_source_values(path, column, chunk_rows=INGEST_CHUNK_ROWS):
+    """Scan only column of path in chunks and return a frame of its unique values and the file's row count"""
+    unique_values = {}
+    row_count = 0
+    for chunk in pd.read_csv(path, usecols=[column], dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        # Dict keys keep the first-occurrence order across chunks
+        unique_values.update(dict.fromkeys(chunk[column].unique()))
+        row_count += len(chunk)
+    return pd.DataFrame({column: list(unique_values)}), row_count
+
+# Function to list the columns added by enrichment
+def get_enrichment_columns():
+    columns = list((st.session_state.location_columns or {}).values()) + [st.session_state.image_column]
+    return [c for c in columns if c and c in st.session_state.data.columns]
+
+# Function to yield the enriched table in chunks
+def iter_enriched_chunks(df, chunk_rows, source_path=None, key_column=None, enrichment_columns=()):
+    """Yield slices of df, or of the source file merged with df's enrichment columns"""
+    if source_path is None:
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+    
+    # Large file mode: df holds one row per value, so merge back by value
+    enrichment = df.drop_duplicates(key_column).set_index(key_column)[list(enrichment_columns)]
+    for chunk in pd.read_csv(source_path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        keys = chunk[key_column]
+        for column in enrichment_columns:
+            chunk[column] = keys.map(enrichment[column])
+        yield chunk
+
+# Function to write the enriched CSV to a temporary file in chunks
+@instrumented(payload=lambda df, *args, **kwargs: int(df.memory_usage(deep=False).sum()))
+def export_enriched_csv(df, image_column=None, chunk_rows=EXPORT_CHUNK_ROWS, source_path=None,
+                        key_column=None, enrichment_columns=(), directory=None):
+    """Stream the enriched table to a temporary CSV file chunk by chunk and return its path"""
+    # An unguessable name, since exports in the static folder are served to anyone with the link
+    fd, path = tempfile.mkstemp(prefix=f"enriched_data_{uuid.uuid4().hex}_", suffix=".csv", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            header = True
+            for chunk in iter_enriched_chunks(df, chunk_rows, source_path, key_column, enrichment_columns):
+                if image_column and image_column in chunk.columns:
+                    # Photos ship in the separate zip, so cells name their file in it
+                    chunk = chunk.copy()
+                    images = {ref: get_export_image_name(ref) for ref in chunk[image_column].dropna().unique()}
+                    chunk[image_column] = chunk[image_column].map(images)
+                chunk.to_csv(f, index=False, header=header)
+                header = False
+            if header:
+                df.iloc[:0].to_csv(f, index=False)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+# Function to get the name a cell's photo has inside the exported zip
+def get_export_image_name(value):
+    """Store references become zip paths; legacy data URIs stay inline"""
+    if is_image_ref(value):
+        return f"{EXPORT_IMAGE_DIR}/{value[len(IMAGE_REF_PREFIX):]}"
+    return value
+
+# Function to write the stored photos to a temporary zip file
+@instrumented()
+def export_images_zip(df, image_column, directory=None):
+    """Copy each referenced photo from the image store into a zip and return its path, or None without photos"""
+    if not image_column or image_column not in df.columns:
+        return None
+    refs = [ref for ref in df[image_column].dropna().unique() if is_image_ref(ref)]
+    if not refs:
+        return None
+    fd, path = tempfile.mkstemp(prefix=f"enriched_data_{uuid.uuid4().hex}_", suffix="_photos.zip", dir=directory)
+    try:
+        # Photos are already compressed, so they are stored as-is and copied from disk one at a time
+        with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for ref in refs:
+                image_path = get_image_path(ref)
+                if os.path.exists(image_path):
+                    archive.write(image_path, arcname=get_export_image_name(ref))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+# Function to offer an exported file for download
+def render_export_download(path, file_name, label, mime, static_serving):
+    """Link to the file when static serving can stream it, otherwise read it only once clicked"""
+    size = os.path.getsize(path)
+    if static_serving and size <= STATIC_FILE_SIZE_LIMIT:
+        st.markdown(
+            f'<a href="{STATIC_EXPORT_URL}/{os.path.basename(path)}" download="{file_name}">⬇️ {label}</a>',
+            unsafe_allow_html=True
+        )
+    elif static_serving:
+        st.warning(
+            f"{file_name} is {size / 2**20:.0f} MB, over the {STATIC_FILE_SIZE_LIMIT // 2**20} MB "
+            f"Streamlit can serve for download. It was saved on the server at {path}."
+        )
+    else:
+        def read_export():
+            with open(path, 'rb') as f:
+                return f.read()
+        st.download_button(label, read_export, file_name=file_name, mime=mime,
+                           on_click="ignore", use_container_width=True)
+
+# Function to remove exports old enough that their download has been taken or abandoned
+def remove_stale_exports(directory, max_age=EXPORT_MAX_AGE_SECONDS):
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.name.startswith("enriched_data_") and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+# Function to create the typed location columns for the selected column
+def ensure_location_columns():
+    """Add any missing location columns and coerce existing ones to their dtypes"""
+    if st.session_state.location_columns is None:
+        st.session_state.location_columns = {
+            field: f"{st.session_state.selected_column}_{field}" for field in LOCATION_FIELDS
+        }
+    data = st.session_state.data
+    for field, dtype in LOCATION_FIELDS.items():
+        column = st.session_state.location_columns[field]
+        if column not in data.columns:
+            data[column] = pd.Series(pd.NaT if field == 'location_time' else np.nan, index=data.index, dtype=dtype)
+        elif field == 'location_time':
+            if not isinstance(data[column].dtype, pd.DatetimeTZDtype):
+                data[column] = pd.to_datetime(data[column], utc=True, errors='coerce')
+        elif data[column].dtype != dtype:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype(dtype)
+    return st.session_state.location_columns
+
+# Function to parse a legacy "lat, lng" location string
+def parse_location_text(text):
+    try:
+        lat, lng = (float(part) for part in str(text).split(','))
+        return {'latitude': lat, 'longitude': lng, 'accuracy': None, 'location_time': None}
+    except ValueError:
+        return None
+
+# Function to convert a legacy "lat, lng" text column into typed columns
+def migrate_location_text_column(column):
+    data = st.session_state.data
+    parts = data[column].astype('string').str.extract(r'^\s*([^,]+?)\s*,\s*([^,]+?)\s*$')
+    ensure_location_columns()
+    data[st.session_state.location_columns['latitude']] = pd.to_numeric(parts[0], errors='coerce').astype('float64')
+    data[st.session_state.location_columns['longitude']] = pd.to_numeric(parts[1], errors='coerce').astype('float64')
+    st.session_state.data = data.drop(columns=[column])
+
+# Function to write one location to a set of rows
+def write_location(rows, location):
+    columns = ensure_location_columns()
+    data = st.session_state.data
+    for field in LOCATION_FIELDS:
+        value = location.get(field)
+        if field == 'location_time':
+            value = pd.NaT if value is None else pd.Timestamp(value)
+            if value is not pd.NaT:
+                value = value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+        elif value is None:
+            value = np.nan
+        data.iloc[rows, data.columns.get_loc(columns[field])] = value
+
+# Function to read the saved location for a value
+def get_value_location(value):
+    """Get the saved location fields for value, or None if none is saved"""
+    if st.session_state.location_columns is None:
+        return None
+    location = {field: get_value_field(value, column) for field, column in st.session_state.location_columns.items()}
+    if location['latitude'] is None or pd.isna(location['latitude']):
+        return None
+    return location
+
+# Function to format a saved location for display
+def format_location(location):
+    text = f"{location['latitude']}, {location['longitude']}"
+    if location.get('accuracy') is not None and not pd.isna(location['accuracy']):
+        text += f" (±{location['accuracy']:.0f} m)"
+    return text
+
+# Function to compute great-circle distances in metres
+def haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+# Function to get the grid cell holding a point
+def get_spatial_cell(lat, lng):
+    return (math.floor(lat / SPATIAL_CELL_DEGREES), math.floor(lng / SPATIAL_CELL_DEGREES) % SPATIAL_CELL_COLUMNS)
+
+# Function to build the spatial index over captured locations
+def build_spatial_index():
+    """Grid the saved location of every value into SPATIAL_CELL_DEGREES cells"""
+    values = get_progress_stats()['values']
+    lat = np.full(len(values), np.nan)
+    lng = np.full(len(values), np.nan)
+    fix_time = np.full(len(values), np.datetime64('NaT', 'ns'))
+    columns = st.session_state.location_columns
+    if columns is not None and len(values) > 0:
+        first_rows = get_value_index()['first_rows']
+        lat = st.session_state.data[columns['latitude']].to_numpy(dtype='float64')[first_rows]
+        lng = st.session_state.data[columns['longitude']].to_numpy(dtype='float64')[first_rows]
+        fix_time = (pd.to_datetime(st.session_state.data[columns['location_time']], utc=True).dt.tz_convert(None)
+                    .to_numpy(dtype='datetime64[ns]')[first_rows])
+    
+    cells = {}
+    for position in np.flatnonzero(~np.isnan(lat)).tolist():
+        cells.setdefault(get_spatial_cell(lat[position], lng[position]), []).append(position)
+    
+    st.session_state.spatial_index = {'values': values, 'lat': lat, 'lng': lng, 'fix_time': fix_time, 'cells': cells}
+    return st.session_state.spatial_index
+
+# Function to get the spatial index, rebuilding it if the values changed
+def get_spatial_index():
+    index = st.session_state.spatial_index
+    if index is None or index['values'] is not get_progress_stats()['values']:
+        return build_spatial_index()
+    return index
+
+# Function to add newly saved locations to the spatial index
+def update_spatial_index(values, lat, lng, fix_time):
+    index = st.session_state.spatial_index
+    if index is None or index['values'] is not get_progress_stats()['values']:
+        # Built lazily from the dataframe on first query instead
+        return
+    positions = get_progress_stats()['positions']
+    for value in values:
+        position = positions[value]
+        if not np.isnan(index['lat'][position]):
+            old_cell = index['cells'][get_spatial_cell(index['lat'][position], index['lng'][position])]
+            old_cell.remove(position)
+        index['lat'][position] = lat
+        index['lng'][position] = lng
+        index['fix_time'][position] = fix_time.tz_convert(None).to_datetime64()
+        index['cells'].setdefault(get_spatial_cell(lat, lng), []).append(position)
+
+# Function to find the values saved within a radius of a point
+def query_radius(index, lat, lng, radius_m):
+    """Return (value positions, distances) within radius_m of the point, nearest first"""
+    lat_span = radius_m / METRES_PER_DEGREE
+    # Widen the longitude span for the most poleward latitude the circle reaches
+    edge_lat = min(abs(lat) + lat_span, 90.0)
+    lng_span = radius_m / (METRES_PER_DEGREE * max(math.cos(math.radians(edge_lat)), 1e-9))
+    y0, y1 = math.floor((lat - lat_span) / SPATIAL_CELL_DEGREES), math.floor((lat + lat_span) / SPATIAL_CELL_DEGREES)
+    x0, x1 = math.floor((lng - lng_span) / SPATIAL_CELL_DEGREES), math.floor((lng + lng_span) / SPATIAL_CELL_DEGREES)
+    if x1 - x0 + 1 >= SPATIAL_CELL_COLUMNS:
+        x0, x1 = 0, SPATIAL_CELL_COLUMNS - 1
+    
+    cells = index['cells']
+    if (y1 - y0 + 1) * (x1 - x0 + 1) <= len(cells):
+        candidates = [
+            position
+            for y in range(y0, y1 + 1)
+            for x in range(x0, x1 + 1)
+            for position in cells.get((y, x % SPATIAL_CELL_COLUMNS), ())
+        ]
+    else:
+        # Wide searches scan the occupied cells rather than the whole window
+        candidates = [
+            position
+            for (y, x), members in cells.items()
+            if y0 <= y <= y1 and (x - x0) % SPATIAL_CELL_COLUMNS <= x1 - x0
+            for position in members
+        ]
+    if not candidates:
+        return np.array([], dtype=int), np.array([])
+    
+    candidates = np.array(candidates)
+    distances = haversine_m(lat, lng, index['lat'][candidates], index['lng'][candidates])
+    inside = distances <= radius_m
+    candidates, distances = candidates[inside], distances[inside]
+    order = np.argsort(distances, kind='stable')
+    return candidates[order], distances[order]
+
+# Function to find the k values saved nearest to a point
+def query_nearest(index, lat, lng, k):
+    """Return the k nearest (value positions, distances) by widening a radius search"""
+    radius_m = SPATIAL_CELL_DEGREES * METRES_PER_DEGREE
+    while True:
+        positions, distances = query_radius(index, lat, lng, radius_m)
+        # Every point within radius_m was found, so the nearest k are final
+        if len(positions) >= k or radius_m >= math.pi * EARTH_RADIUS_M:
+            return positions[:k], distances[:k]
+        radius_m *= 4
+
+# Function to find saved locations that are suspiciously close together
+def find_duplicate_locations(index, radius_m, limit=SEARCH_RESULT_LIMIT):
+    """Return up to limit (value, value, distance) pairs saved within radius_m of each other, closest first"""
+    lat, lng, cells = index['lat'], index['lng'], index['cells']
+    fix_time = index['fix_time']
+    found = []
+    for (y, x), members in cells.items():
+        own = np.array(members)
+        # Compare each cell with itself and the neighbours after it, so every pair is seen once
+        for dy, dx in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+            other = cells.get((y + dy, (x + dx) % SPATIAL_CELL_COLUMNS))
+            if not other:
+                continue
+            other = np.array(other)
+            for start in range(0, len(own), DUPLICATE_BLOCK_ROWS):
+                block = own[start:start + DUPLICATE_BLOCK_ROWS]
+                distances = haversine_m(lat[block][:, None], lng[block][:, None], lat[other][None, :], lng[other][None, :])
+                # Batch mode saves one fix, position and time alike, for many values; other identical fixes still count
+                same_batch = (distances == 0) & (fix_time[block][:, None] == fix_time[other][None, :])
+                close = (distances <= radius_m) & ~same_batch
+                if dy == 0 and dx == 0:
+                    close &= block[:, None] < other[None, :]
+                i, j = np.nonzero(close)
+                found.extend(zip(block[i].tolist(), other[j].tolist(), distances[i, j].tolist()))
+    
+    found.sort(key=lambda pair: pair[2])
+    values = index['values']
+    return [(values[a], values[b], distance) for a, b, distance in found[:limit]]
 
 # Save location data
-def save_location(value, lat, lng):
-    if st.session_state.location_column is None:
-        st.session_state.location_column = f"{st.session_state.selected_column}_location"
-        if st.session_state.location_column not in st.session_state.data.columns:
-            st.session_state.data[st.session_state.location_column] = None
-    
-    # Find the row index for the value
-    row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == str(value)].index
-    if not row_idx.empty:
-        st.session_state.data.loc[row_idx, st.session_state.location_column] = f"{lat}, {lng}"
-        st.session_state.progress[value]['location'] = True
-        
-        # Set flag to show success message
-        st.session_state.location_saved = True
+@instrumented()
+def save_location(value, lat, lng, accuracy=None, fix_time=None):
+    return save_locations([value], lat, lng, accuracy, fix_time)
+
+# Save one location fix for several values at once
+@instrumented()
+def save_locations(values, lat, lng, accuracy=None, fix_time=None):
+    """Apply a location to every value with one dataframe update and one journal write"""
+    # Find the row positions for the values
+    found = [(value, get_value_rows(value)) for value in values]
+    found = [(value, rows) for value, rows in found if len(rows) > 0]
+    if not found:
+        return False
+    
+    # Geolocation timestamps are milliseconds since the epoch
+    if fix_time is None:
+        fix_time = pd.Timestamp.now(tz='UTC')
+    elif not isinstance(fix_time, pd.Timestamp):
+        fix_time = pd.Timestamp(fix_time, unit='ms', tz='UTC')
+    location = {
+        'latitude': float(lat),
+        'longitude': float(lng),
+        'accuracy': None if accuracy is None else float(accuracy),
+        'location_time': fix_time
+    }
+    write_location(np.concatenate([rows for _, rows in found]), location)
+    update_spatial_index([value for value, _ in found], location['latitude'], location['longitude'], fix_time)
+    
+    payload = dict(location, location_time=fix_time.isoformat())
+    timestamp = datetime.now().isoformat()
+    records = []
+    for value, _ in found:
+        mark_progress(value, 'location')
         
         # Keep track of open expanders
         if not st.session_state.progress[value]['image']:
             st.session_state.open_expanders.add(value)
         else:
             # Both are complete, so remove from open expanders
-            if value in st.session_state.open_expanders:
-                st.session_state.open_expanders.remove(value)
-                
-        save_app_state()  # Save state after location update
-        return True
-    return False
+            st.session_state.open_expanders.discard(value)
+        
+        records.append({
+            'value': value,
+            'field': 'location',
+            'column': None,
+            'payload': payload,
+            'timestamp': timestamp
+        })
+    
+    # Set flag to show success message
+    st.session_state.location_saved = True
+    
+    # Journal just these edits instead of rewriting the whole state
+    append_journal_records(records)
+    return True
 
-# Save image data as base64 encoded string
-def save_image(value, image_data):
+# Shared pool that encodes photos off the script thread for every session
+@st.cache_resource
+def get_image_worker_pool():
+    return ThreadPoolExecutor(max_workers=IMAGE_WORKER_COUNT, thread_name_prefix="image-encoder")
+
+# Slots capping how many photos may wait in the pool across all sessions
+@st.cache_resource
+def get_image_job_slots():
+    return threading.BoundedSemaphore(MAX_PENDING_IMAGE_JOBS)
+
+# Function run by the worker pool to encode and store a photo
+def encode_and_store_image(image_data, profile):
+    """Compress raw camera bytes and write them to the image store"""
+    return store_image(encode_image(image_data, profile), get_image_extension(profile))
+
+# Function to get the image store extension for a photo as the camera sent it
+def get_raw_image_extension(image_data):
+    """Read only the image header and return None when the bytes are not a readable image"""
+    try:
+        img = Image.open(BytesIO(image_data))
+    except Exception:
+        return None
+    return mimetypes.guess_extension(Image.MIME.get(img.format, '')) or '.img'
+
+# Record a stored image reference against a value
+def finish_image_save(value, image_ref):
+    rows = get_value_rows(value)
+    if len(rows) == 0:
+        return False
+    
+    col_idx = st.session_state.data.columns.get_loc(st.session_state.image_column)
+    st.session_state.data.iloc[rows, col_idx] = image_ref
+    mark_progress(value, 'image')
+    
+    # Keep track of open expanders
+    if not st.session_state.progress[value]['location']:
+        st.session_state.open_expanders.add(value)
+    else:
+        # Both are complete, so remove from open expanders
+        if value in st.session_state.open_expanders:
+            st.session_state.open_expanders.remove(value)
+    
+    # Journal just this edit instead of rewriting the whole state
+    append_journal(value, 'image', st.session_state.image_column, image_ref)
+    return True
+
+# Function to check whether a photo already meets the encoding profile
+def is_encoded_photo(image_data, profile):
+    """Read only the image header, so the check stays cheap for full camera frames"""
+    try:
+        img = Image.open(BytesIO(image_data))
+    except Exception:
+        return False
+    return fits_image_profile(img, len(image_data), profile)
+
+# Save image data to the image store and keep its reference
+@instrumented(payload=lambda value, image_data, background=True: len(image_data))
+def save_image(value, image_data, background=True):
+    """Store a photo for value, encoding it on the worker pool unless background is False"""
     if st.session_state.image_column is None:
         st.session_state.image_column = f"{st.session_state.selected_column}_image"
         if st.session_state.image_column not in st.session_state.data.columns:
             st.session_state.data[st.session_state.image_column] = None
     
     try:
-        # Compress and encode the image
-        base64_image = compress_and_encode_image(image_data)
+        # Find the row positions for the value
+        if len(get_value_rows(value)) == 0:
+            return False
         
-        if base64_image:
-            # Find the row index for the value
-            row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == str(value)].index
-            if not row_idx.empty:
-                # Store base64 image directly in the dataframe
-                st.session_state.data.loc[row_idx, st.session_state.image_column] = base64_image
-                st.session_state.progress[value]['image'] = True
-                
-                # Keep track of open expanders
-                if not st.session_state.progress[value]['location']:
-                    st.session_state.open_expanders.add(value)
-                else:
-                    # Both are complete, so remove from open expanders
-                    if value in st.session_state.open_expanders:
-                        st.session_state.open_expanders.remove(value)
-                
-                save_app_state()  # Save state after image update
-                return True
+        # Photos already downscaled in the browser are stored as they are
+        profile = get_image_profile()
+        if is_encoded_photo(image_data, profile):
+            st.session_state.pending_images.pop(value, None)
+            return finish_image_save(value, store_image(image_data, get_image_extension(profile)))
+        
+        # Queue the photo for background encoding while the pool has room
+        slots = get_image_job_slots()
+        if background and slots.acquire(blocking=False):
+            try:
+                # Journal the photo as sent before queueing it, so it survives the browser disconnecting
+                raw_extension = get_raw_image_extension(image_data)
+                if raw_extension is None:
+                    st.error("Failed to process image")
+                    slots.release()
+                    return False
+                raw_ref = store_image(image_data, raw_extension)
+                finish_image_save(value, raw_ref)
+                future = get_image_worker_pool().submit(encode_and_store_image, image_data, profile)
+            except Exception:
+                slots.release()
+                raise
+            future.raw_ref = raw_ref
+            future.add_done_callback(lambda _: slots.release())
+            if st.session_state.timings_enabled:
+                # Stamp the worker's finish time so collection can record the encode latency
+                future.timing = (time.perf_counter(), len(image_data))
+                future.add_done_callback(lambda f: setattr(f, 'finished_at', time.perf_counter()))
+            st.session_state.pending_images[value] = future
+            return True
+        
+        # Encode inline when asked to, or when the queue is full rather than grow it further
+        st.session_state.pending_images.pop(value, None)
+        image_bytes = compress_image(image_data, profile)
+        if image_bytes:
+            # Write the image to disk and keep only its reference in the dataframe
+            return finish_image_save(value, store_image(image_bytes, get_image_extension(profile)))
         else:
             st.error("Failed to process image")
     except Exception as e:
         st.error(f"Error saving image: {e}")
     return False
 
-# Display image from base64
-def display_image_from_base64(base64_string, width=200):
-    if base64_string and isinstance(base64_string, str) and base64_string.startswith('data:image'):
-        st.markdown(f'<img src="{base64_string}" width="{width}" style="border-radius: 5px;">', unsafe_allow_html=True)
+# Apply photos the worker pool has finished encoding
+@instrumented()
+def collect_pending_images():
+    finished = [value for value, future in st.session_state.pending_images.items() if future.done()]
+    for value in finished:
+        future = st.session_state.pending_images.pop(value)
+        if hasattr(future, 'timing'):
+            # The done callback may still be running, in which case it finished just now
+            submitted_at, payload_bytes = future.timing
+            finished_at = getattr(future, 'finished_at', time.perf_counter())
+            record_timing("encode_and_store_image (background)", finished_at - submitted_at, payload_bytes)
+        try:
+            image_ref = future.result()
+        except Exception as e:
+            st.error(f"Error encoding image for {value}, keeping the original photo: {e}")
+            continue
+        swap_in_encoded_image(value, future.raw_ref, image_ref)
+    return len(finished)
+
+# Swap a finished encode in for the original photo it was made from
+def swap_in_encoded_image(value, raw_ref, image_ref):
+    """Replace raw_ref with image_ref unless the value has been given another photo since"""
+    rows = get_value_rows(value)
+    if len(rows) == 0 or st.session_state.data[st.session_state.image_column].iat[rows[0]] != raw_ref:
+        return False
+    return finish_image_save(value, image_ref)
+
+# Poll for finished photos and rerun the app once any are ready
+@st.fragment(run_every=PENDING_IMAGE_POLL_SECONDS)
+def watch_pending_images():
+    pending = st.session_state.pending_images
+    if any(future.done() for future in pending.values()):
+        st.rerun()
+    if pending:
+        st.caption(f"⏳ Processing {len(pending)} photo(s)...")
+
+# Function to make a small thumbnail for a stored image, cached across sessions
+@st.cache_data(max_entries=THUMBNAIL_CACHE_ENTRIES, show_spinner=False)
+def get_thumbnail(image):
+    """Downscale the image behind a cell value once and keep the result in an LRU cache"""
+    image_bytes = load_image_bytes(image)
+    if not image_bytes:
+        return None
+    img = Image.open(BytesIO(image_bytes))
+    # Let the JPEG decoder skip detail the thumbnail will not use
+    img.draft('RGB', THUMBNAIL_SIZE)
+    img = img.convert('RGB')
+    img.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+    
+    output = BytesIO()
+    # JPEG, since st.image re-encodes any other format on every rerun
+    img.save(output, format='JPEG', quality=THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+# Function to get a full-size stored photo as JPEG, cached across sessions
+@st.cache_data(max_entries=FULL_IMAGE_CACHE_ENTRIES, show_spinner=False)
+def get_jpeg_image(image):
+    """Transcode a WebP or AVIF photo once instead of letting st.image do it on every rerun"""
+    image_bytes = load_image_bytes(image)
+    if not image_bytes:
+        return None
+    output = BytesIO()
+    Image.open(BytesIO(image_bytes)).convert('RGB').save(output, format='JPEG', quality=IMAGE_QUALITY)
+    return output.getvalue()
+
+# Display image from the image store or a base64 data URI
+def display_image(image, key, width=200):
+    try:
+        thumbnail = get_thumbnail(image)
+    except Exception:
+        thumbnail = None
+    
+    if thumbnail:
+        st.image(thumbnail, width=width)
+        # Only send the full-size photo when it is asked for
+        if st.checkbox("Show full image", key=f"{key}_full_image"):
+            full_image = load_image_bytes(image)
+            # JPEGs are sent as they are; other formats go through the cached transcode
+            if full_image and Image.open(BytesIO(full_image)).format != 'JPEG':
+                full_image = get_jpeg_image(image)
+            st.image(full_image, use_container_width=True)
     else:
         st.write("No image available")
 
+# Function to get a downscaled preview of the current capture
+def get_capture_preview(photo_bytes):
+    """Downscale a camera frame once per capture and reuse it across reruns"""
+    # A length plus CRC32 key is cheap to recompute on every rerun
+    digest = (len(photo_bytes), zlib.crc32(photo_bytes))
+    cached = st.session_state.temp_preview
+    if cached is not None and cached['digest'] == digest:
+        return cached['image']
+    
+    img = Image.open(BytesIO(photo_bytes))
+    # For JPEGs, decode at a reduced scale instead of the full sensor resolution
+    img.draft('RGB', PREVIEW_SIZE)
+    img = img.convert('RGB')
+    img.thumbnail(PREVIEW_SIZE, Image.BILINEAR)
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=PREVIEW_QUALITY)
+    
+    st.session_state.temp_preview = {'digest': digest, 'image': output.getvalue()}
+    return st.session_state.temp_preview['image']
+
+# Function to build a search index over the values of a column, cached per dataset and column
+@st.cache_data(max_entries=VALUE_INDEX_CACHE_ENTRIES, show_spinner=False)
+def build_search_index(_values, fingerprint, column):
+    """Index lowercased values by sorted prefix, by every 1-3 character gram and by the grams that start a word"""
+    lowered = [str(v).lower() for v in _values]
+    grams, word_grams = {}, {}
+    for i, text in enumerate(lowered):
+        found = {text[j:j + n] for n in range(1, SEARCH_GRAM_SIZE + 1) for j in range(len(text) - n + 1)}
+        for gram in found:
+            grams.setdefault(gram, []).append(i)
+        # Words after the first, so short searches can rank word-start matches without scanning them all
+        starts = {text[j:j + n] for j in range(1, len(text)) if not text[j - 1].isalnum()
+                  for n in range(1, SEARCH_GRAM_SIZE + 1)}
+        for gram in starts:
+            word_grams.setdefault(gram, []).append(i)
+    # Sorted int32 postings keep the index compact and let numpy intersect them
+    prefix_order = sorted(range(len(lowered)), key=lowered.__getitem__)
+    return {
+        'lowered': lowered,
+        'grams': {gram: np.array(rows, dtype=np.int32) for gram, rows in grams.items()},
+        'word_grams': {gram: np.array(rows, dtype=np.int32) for gram, rows in word_grams.items()},
+        'prefix_keys': [lowered[i] for i in prefix_order],
+        'prefix_order': np.array(prefix_order, dtype=np.int32)
+    }
+
+# Function to get the search index for the selected column
+def get_search_index():
+    values = get_progress_stats()['values']
+    index = st.session_state.search_index
+    if index is None or index['values'] is not values:
+        column = st.session_state.selected_column
+        index = st.session_state.search_index = dict(
+            build_search_index(values, get_column_fingerprint(column), column), values=values
+        )
+    return index
+
+# Function to check whether a search term starts any word after the first
+def starts_later_word(text, search_term):
+    at = text.find(search_term, 1)
+    while at != -1:
+        if not text[at - 1].isalnum():
+            return True
+        at = text.find(search_term, at + 1)
+    return False
+
 # Filter values based on search term
-def filter_values(values, search_term):
+@instrumented()
+def filter_values(search_index, search_term, limit=SEARCH_RESULT_LIMIT):
+    """Return up to limit ranked matches for search_term and the total match count"""
+    values = search_index['values']
     if not search_term:
-        return values
+        return values, len(values)
     search_term = str(search_term).lower()
-    return [v for v in values if search_term in str(v).lower()]
+    lowered = search_index['lowered']
+    no_rows = np.empty(0, dtype=np.int32)
+    
+    # Intersect the postings of the query's grams, then confirm the full substring
+    grams = {search_term[j:j + SEARCH_GRAM_SIZE] for j in range(max(1, len(search_term) - SEARCH_GRAM_SIZE + 1))}
+    postings = sorted((search_index['grams'].get(gram, no_rows) for gram in grams), key=len)
+    if len(postings) == 1 and len(search_term) <= SEARCH_GRAM_SIZE:
+        matches = postings[0]
+    else:
+        candidates = functools.reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), postings)
+        matches = np.array([i for i in candidates.tolist() if search_term in lowered[i]], dtype=np.int32)
+    
+    # Exact and prefix matches come first, straight from the sorted prefix index
+    keys = search_index['prefix_keys']
+    lo = bisect.bisect_left(keys, search_term)
+    # The highest code point bounds the range, so prefixes followed by emoji or other astral characters stay inside it
+    hi = bisect.bisect_left(keys, search_term + '\U0010ffff', lo)
+    exact_end = bisect.bisect_right(keys, search_term, lo, hi)
+    order = search_index['prefix_order']
+    ranked = np.concatenate([np.sort(order[lo:exact_end]), np.sort(order[exact_end:hi])])
+    
+    # Then matches starting a later word, then any other substring, in column order
+    if len(ranked) < limit:
+        rest = np.setdiff1d(matches, ranked, assume_unique=True)
+        word_grams = search_index['word_grams'].get(search_term[:SEARCH_GRAM_SIZE], no_rows)
+        word_starts = np.isin(rest, word_grams, assume_unique=True)
+        if len(search_term) > SEARCH_GRAM_SIZE:
+            # A word starting with the term's first gram may not continue with the rest of it, so confirm
+            # in column order and stop once the word starts alone fill the list
+            candidates, needed = np.flatnonzero(word_starts).tolist(), limit - len(ranked)
+            word_starts[:] = False
+            for k in candidates:
+                if starts_later_word(lowered[rest[k]], search_term):
+                    word_starts[k] = True
+                    needed -= 1
+                    if needed == 0:
+                        break
+        ranked = np.concatenate([ranked, rest[word_starts], rest[~word_starts]])
+    return [values[i] for i in ranked[:limit].tolist()], len(matches)
+
+# Function to rerun only the running fragment, or the whole app during a full run
+def rerun_fragment():
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # Fragment-scoped reruns are only allowed while the fragment reruns on its own
+        st.rerun()
 
 # Get and save location with optimized performance
 def get_and_save_location(value, prefix=""):
@@ -372,7 +1819,7 @@ def get_and_save_location(value, prefix=""):
                     # Add cancel option
                     if st.button("Cancel", key=f"{prefix}_cancel_loc_{value}"):
                         st.session_state.location_requested[loc_request_key] = False
-                        st.rerun()
+                        rerun_fragment()
                 elif isinstance(location_data, dict) and 'coords' in location_data:
                     # We have the location data!
                     coords = location_data['coords']
@@ -380,12 +1827,12 @@ def get_and_save_location(value, prefix=""):
                     longitude = coords['longitude']
                     
                     # Save to dataframe
-                    if save_location(value, latitude, longitude):
+                    if save_location(value, latitude, longitude, coords.get('accuracy'), location_data.get('timestamp')):
                         # The success message will be shown on the next run
                         # Reset flag
                         st.session_state.location_requested[loc_request_key] = False
-                        # Force a rerun to update the UI with the location saved
-                        st.rerun()  
+                        # Rerun the values page to update the UI with the location saved
+                        rerun_fragment()
                     else:
                         st.error("Failed to save location data")
                 else:
@@ -394,11 +1841,608 @@ def get_and_save_location(value, prefix=""):
             st.error(f"Error getting location: {str(e)}")
             if st.button("Cancel", key=f"{prefix}_error_cancel_{value}"):
                 st.session_state.location_requested[loc_request_key] = False
-                st.rerun()
+                rerun_fragment()
     
     # Return whether the location is already saved to indicate status in UI
     return st.session_state.progress.get(value, {}).get('location', False)
 
+# Capture one location fix and apply it to several values
+def render_batch_location(candidates):
+    if st.session_state.batch_location_saved:
+        st.success(f"Location saved for {st.session_state.batch_location_saved} values!")
+        st.session_state.batch_location_saved = 0
+    
+    # A fresh key after each batch clears the selection
+    selected = st.multiselect(
+        "Values at this site:", candidates,
+        key=f"batch_location_values_{st.session_state.batch_location_round}"
+    )
+    if not selected:
+        st.session_state.batch_location_requested = False
+        return
+    
+    if st.button(f"📍 Get Location for {len(selected)} selected", key="batch_getloc") or st.session_state.batch_location_requested:
+        st.session_state.batch_location_requested = True
+        
+        try:
+            with st.spinner("Getting your location..."):
+                location_data = get_geolocation(component_key="batch_location")
+            
+            if isinstance(location_data, dict) and 'coords' in location_data:
+                coords = location_data['coords']
+                if save_locations(selected, coords['latitude'], coords['longitude'],
+                                  coords.get('accuracy'), location_data.get('timestamp')):
+                    st.session_state.batch_location_requested = False
+                    st.session_state.batch_location_saved = len(selected)
+                    st.session_state.batch_location_round += 1
+                    st.rerun()
+                else:
+                    st.error("Failed to save location data")
+            else:
+                st.warning("Waiting for location permission... If no prompt appears, please check your browser settings.")
+                if st.button("Cancel", key="batch_cancel_loc"):
+                    st.session_state.batch_location_requested = False
+                    st.rerun()
+        except Exception as e:
+            st.error(f"Error getting location: {str(e)}")
+            if st.button("Cancel", key="batch_error_cancel"):
+                st.session_state.batch_location_requested = False
+                st.rerun()
+
+# Function to take a photo that the browser resizes and JPEG-encodes before upload
+def browser_camera_input(key, max_size=IMAGE_MAX_SIZE, quality=IMAGE_QUALITY):
+    """Return the captured JPEG bytes once the browser has sent them, otherwise None"""
+    photo_uri = streamlit_js_eval(js_expressions="""(() => {
+        setFrameHeight(60);
+        document.body.insertAdjacentHTML('beforeend',
+            '<label style="display: inline-block; padding: 10px 16px; border: 1px solid #999; border-radius: 6px; ' +
+            'font-family: sans-serif; cursor: pointer;">📸 Take photo' +
+            '<input id="capture" type="file" accept="image/*" capture="environment" style="display: none;"></label> ' +
+            '<span id="capture-status" style="font-family: sans-serif;"></span>');
+        return new Promise(function(resolve) {
+            document.getElementById('capture').addEventListener('change', function(event) {
+                const file = event.target.files[0];
+                if (!file) return;
+                document.getElementById('capture-status').textContent = 'Resizing...';
+                createImageBitmap(file).then(function(bitmap) {
+                    const scale = Math.min(1, __MAX_WIDTH__ / bitmap.width, __MAX_HEIGHT__ / bitmap.height);
+                    const canvas = document.createElement('canvas');
+                    canvas.width = Math.round(bitmap.width * scale);
+                    canvas.height = Math.round(bitmap.height * scale);
+                    canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+                    document.getElementById('capture-status').textContent = 'Sending...';
+                    resolve(canvas.toDataURL('image/jpeg', __QUALITY__));
+                }).catch(function(error) {
+                    document.getElementById('capture-status').textContent = 'Could not read photo: ' + error.message;
+                });
+            });
+        });
+    })()"""
+        .replace("__MAX_WIDTH__", str(max_size[0]))
+        .replace("__MAX_HEIGHT__", str(max_size[1]))
+        .replace("__QUALITY__", str(quality / 100)), key=key)
+    if not isinstance(photo_uri, str) or not photo_uri.startswith("data:image/"):
+        return None
+    return base64.b64decode(photo_uri.split(',', 1)[1])
+
+# Browser-side capture queue: captures go to localStorage and work without a connection
+OFFLINE_QUEUE_HTML = """
+<div style="font-family: sans-serif; font-size: 14px;">
+    <input id="value" list="values" placeholder="Value to capture" style="width: 100%; padding: 6px; margin-bottom: 6px; box-sizing: border-box;">
+    <datalist id="values"></datalist>
+    <button id="queue-location" style="padding: 6px 12px;">📍 Queue location</button>
+    <label style="padding: 6px 12px; border: 1px solid #999; border-radius: 3px; cursor: pointer;">
+        📸 Queue photo<input id="queue-photo" type="file" accept="image/*" capture="environment" style="display: none;">
+    </label>
+    <p id="status"></p>
+</div>
+<script>
+const KEY = __QUEUE_KEY__;
+const VALUES = __VALUES__;
+const MAX_SIZE = __MAX_SIZE__;
+const QUALITY = __QUALITY__;
+
+const list = document.getElementById('values');
+VALUES.forEach(function(value) {
+    const option = document.createElement('option');
+    option.value = value;
+    list.appendChild(option);
+});
+
+function readQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(KEY) || '[]');
+    } catch (e) {
+        return [];
+    }
+}
+
+function showStatus(message) {
+    const queue = readQueue();
+    const photos = queue.filter(function(item) { return item.kind === 'photo'; }).length;
+    document.getElementById('status').textContent = (message ? message + ' ' : '') +
+        queue.length + ' queued (' + photos + ' photos)' + (navigator.onLine ? '' : ' - offline');
+}
+
+function enqueue(item) {
+    const queue = readQueue();
+    item.id = Date.now().toString(36) + Math.random().toString(36).slice(2);
+    queue.push(item);
+    try {
+        localStorage.setItem(KEY, JSON.stringify(queue));
+        showStatus('Queued ' + item.kind + ' for ' + item.value + '.');
+    } catch (e) {
+        showStatus('Browser storage is full - sync before queueing more photos.');
+    }
+}
+
+function currentValue() {
+    const value = document.getElementById('value').value.trim();
+    if (!value) {
+        showStatus('Choose a value first.');
+    }
+    return value;
+}
+
+document.getElementById('queue-location').addEventListener('click', function() {
+    const value = currentValue();
+    if (!value) return;
+    showStatus('Getting location...');
+    navigator.geolocation.getCurrentPosition(
+        function(position) {
+            enqueue({
+                kind: 'location',
+                value: value,
+                latitude: position.coords.latitude,
+                longitude: position.coords.longitude,
+                accuracy: position.coords.accuracy,
+                timestamp: position.timestamp
+            });
+        },
+        function(error) { showStatus('Location failed: ' + error.message + '.'); },
+        { enableHighAccuracy: true, timeout: 20000, maximumAge: 0 }
+    );
+});
+
+document.getElementById('queue-photo').addEventListener('change', function(event) {
+    const file = event.target.files[0];
+    const value = currentValue();
+    event.target.value = '';
+    if (!file || !value) return;
+    
+    // Downscale in the browser so only small JPEGs are stored and uploaded
+    createImageBitmap(file).then(function(bitmap) {
+        const scale = Math.min(1, MAX_SIZE / Math.max(bitmap.width, bitmap.height));
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        enqueue({ kind: 'photo', value: value, photo: canvas.toDataURL('image/jpeg', QUALITY), timestamp: Date.now() });
+    }).catch(function(error) { showStatus('Could not read photo: ' + error.message + '.'); });
+});
+
+window.addEventListener('online', function() { showStatus(); });
+window.addEventListener('offline', function() { showStatus(); });
+window.addEventListener('storage', function() { showStatus(); });
+showStatus();
+</script>
+"""
+
+# Function to apply captures synced from the browser queue
+@instrumented()
+def apply_queued_captures(items):
+    """Save queued captures, returning the ids safe to drop from the queue, the held items and the applied count"""
+    done, held, applied = [], [], 0
+    for item in items:
+        try:
+            value = item['value']
+            if len(get_value_rows(value)) == 0:
+                # Captures for unknown values stay on the device so they can be moved to the right value
+                held.append({'id': item['id'], 'kind': item['kind'], 'value': value, 'reason': "unknown value"})
+                continue
+            if item['kind'] == 'location':
+                saved = save_location(value, item['latitude'], item['longitude'],
+                                      item.get('accuracy'), item.get('timestamp'))
+            elif item['kind'] == 'photo':
+                # Encode inline so the photo is journaled before the browser drops its copy
+                encoded = item['photo'].split(',', 1)[1]
+                saved = save_image(value, base64.b64decode(encoded), background=False)
+            else:
+                raise ValueError(f"Unknown capture kind: {item['kind']}")
+        except (KeyError, IndexError, TypeError, ValueError):
+            # Malformed entries are dropped from the queue rather than retried forever
+            if isinstance(item, dict) and 'id' in item:
+                done.append(item['id'])
+            continue
+        if saved:
+            done.append(item['id'])
+            applied += 1
+        else:
+            held.append({'id': item['id'], 'kind': item['kind'], 'value': value, 'reason': "could not be saved"})
+    return done, held, applied
+
+# Render the captures a sync left in the queue, with a way to move each to another value
+def render_held_captures(result, candidates, queue_key):
+    move = st.session_state.offline_move
+    if move is not None:
+        moved = streamlit_js_eval(
+            js_expressions=f"(() => {{ const queue = JSON.parse(localStorage.getItem({queue_key}) || '[]'); "
+                           f"queue.forEach(item => {{ if (item.id === {json.dumps(move['id'])}) item.value = {json.dumps(move['value'])}; }}); "
+                           f"localStorage.setItem({queue_key}, JSON.stringify(queue)); return true; }})()",
+            key=f"offline_move_{move['key']}"
+        )
+        if moved is None:
+            st.info("Moving the capture...")
+            return
+        result['held'] = [item for item in result['held'] if item['id'] != move['id']]
+        st.session_state.offline_move = None
+        st.rerun()
+    
+    st.warning(f"{len(result['held'])} captures are still queued on this device. Move them to the right value and sync again.")
+    options = [str(v) for v in candidates]
+    for item in result['held'][:OFFLINE_SYNC_BATCH]:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            new_value = st.selectbox(
+                f"{item['kind'].capitalize()} queued for '{item['value']}' ({item['reason']})",
+                options, key=f"offline_move_value_{item['id']}"
+            )
+        with col2:
+            if st.button("Move", key=f"offline_move_button_{item['id']}", disabled=new_value is None):
+                st.session_state.offline_move = {'id': item['id'], 'value': new_value, 'key': uuid.uuid4().hex}
+                st.rerun()
+
+# Render the browser-side capture queue and sync it to the server in batches
+def render_offline_queue(candidates):
+    # Each target queues separately, so captures sync back to the dataset they were taken for
+    queue_name = f"{OFFLINE_QUEUE_PREFIX}{st.session_state.session_id}"
+    if st.session_state.active_target != DEFAULT_TARGET_ID:
+        queue_name = f"{queue_name}_{st.session_state.active_target}"
+    queue_key = json.dumps(queue_name)
+    st.caption("Captures queue up in this browser and keep working without a connection. Sync them once you are back online.")
+    st.components.v1.html(
+        OFFLINE_QUEUE_HTML
+        .replace("__QUEUE_KEY__", queue_key)
+        .replace("__VALUES__", json.dumps([str(v) for v in candidates]).replace("</", "<\\/"))
+        .replace("__MAX_SIZE__", str(CLIENT_PHOTO_MAX_SIZE))
+        .replace("__QUALITY__", str(CLIENT_PHOTO_QUALITY)),
+        height=150
+    )
+    
+    sync = st.session_state.offline_sync
+    if sync is None:
+        result = st.session_state.offline_sync_result
+        if result is not None:
+            st.success(f"Synced {result['applied']} queued captures" +
+                       (f", dropped {result['dropped']} unreadable ones" if result['dropped'] else "") + ".")
+            if result['held']:
+                render_held_captures(result, candidates, queue_key)
+        if st.button("🔄 Sync queued captures", key="offline_sync_start"):
+            # A fresh id per sync keeps earlier syncs' component values from being reused
+            st.session_state.offline_sync = {
+                'id': uuid.uuid4().hex, 'round': 0, 'stage': 'fetch', 'ids': [], 'held': [], 'applied': 0, 'dropped': 0
+            }
+            st.session_state.offline_sync_result = None
+            st.session_state.offline_move = None
+            st.rerun()
+        return
+    
+    if st.button("Cancel sync", key="offline_sync_cancel"):
+        st.session_state.offline_sync = None
+        st.rerun()
+    
+    # Held captures stay in the queue, so later batches skip over them
+    held_ids = json.dumps([item['id'] for item in sync['held']])
+    if sync['stage'] == 'fetch':
+        # Read the oldest batch of the queue out of localStorage
+        batch = streamlit_js_eval(
+            js_expressions=f"(() => {{ const held = new Set({held_ids}); "
+                           f"const queue = JSON.parse(localStorage.getItem({queue_key}) || '[]').filter(item => !held.has(item.id)); "
+                           f"return JSON.stringify(queue.slice(0, {OFFLINE_SYNC_BATCH})); }})()",
+            key=f"offline_fetch_{sync['id']}_{sync['round']}"
+        )
+        if batch is None:
+            st.info("Reading queued captures from this browser...")
+            return
+        items = json.loads(batch)
+        if not items:
+            st.session_state.offline_sync = None
+            st.session_state.offline_sync_result = {
+                'applied': sync['applied'], 'dropped': sync['dropped'], 'held': sync['held']
+            }
+            st.rerun()
+        done, held, applied = apply_queued_captures(items)
+        sync.update(stage='ack', ids=done, held=sync['held'] + held, applied=sync['applied'] + applied,
+                    dropped=sync['dropped'] + len(done) - applied)
+        held_ids = json.dumps([item['id'] for item in sync['held']])
+    
+    # Drop the saved batch from the queue; a batch saved but not dropped is saved again harmlessly
+    remaining = streamlit_js_eval(
+        js_expressions=f"(() => {{ const done = new Set({json.dumps(sync['ids'])}); const held = new Set({held_ids}); "
+                       f"const queue = JSON.parse(localStorage.getItem({queue_key}) || '[]').filter(item => !done.has(item.id)); "
+                       f"localStorage.setItem({queue_key}, JSON.stringify(queue)); "
+                       f"return queue.filter(item => !held.has(item.id)).length; }})()",
+        key=f"offline_ack_{sync['id']}_{sync['round']}"
+    )
+    if remaining is None:
+        st.info(f"Synced {sync['applied']} captures so far...")
+        return
+    if remaining > 0:
+        sync.update(round=sync['round'] + 1, stage='fetch', ids=[])
+    else:
+        st.session_state.offline_sync = None
+        st.session_state.offline_sync_result = {
+            'applied': sync['applied'], 'dropped': sync['dropped'], 'held': sync['held']
+        }
+    st.rerun()
+
+# Render the nearby view over captured locations
+def render_nearby_view(filtered_values):
+    index = get_spatial_index()
+    if np.isnan(index['lat']).all():
+        st.info("No locations captured yet!")
+        return
+    
+    # Offer the located values among the search results as centres
+    positions = get_progress_stats()['positions']
+    if len(filtered_values) == len(index['values']):
+        # Without a search every value is a result, so pick the located ones in one pass
+        located = np.flatnonzero(~np.isnan(index['lat']))[:SEARCH_RESULT_LIMIT]
+        centers = [index['values'][p] for p in located.tolist()]
+    else:
+        centers = [v for v in filtered_values if not np.isnan(index['lat'][positions[v]])]
+    if not centers:
+        st.info(f"No located values match your search: '{st.session_state.search_term}'")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        center_value = st.selectbox("Near value:", centers, key="nearby_center", help="Search above to narrow this list")
+    with col2:
+        radius_m = st.number_input("Radius (m):", min_value=1.0, value=float(NEARBY_DEFAULT_RADIUS_M), step=50.0)
+    with col3:
+        k = st.number_input("Nearest values:", min_value=1, value=NEARBY_DEFAULT_K, step=1)
+    
+    center = positions[center_value]
+    lat, lng = index['lat'][center], index['lng'][center]
+    positions, distances = query_radius(index, lat, lng, radius_m)
+    if len(positions) < k + 1:
+        # Fall back to the nearest values when few are inside the radius
+        positions, distances = query_nearest(index, lat, lng, k + 1)
+    keep = positions != center
+    positions, distances = positions[keep], distances[keep]
+    
+    st.write(f"{len(positions)} values near **{center_value}**")
+    st.dataframe(pd.DataFrame({
+        'value': [index['values'][p] for p in positions.tolist()],
+        'distance_m': distances.round(1),
+        'latitude': index['lat'][positions],
+        'longitude': index['lng'][positions]
+    }), hide_index=True, use_container_width=True)
+    
+    # Possible duplicate captures: different values recorded at almost the same spot
+    if st.button("Find possible duplicate captures", key="nearby_duplicates"):
+        pairs = find_duplicate_locations(index, DUPLICATE_RADIUS_M)
+        if pairs:
+            st.dataframe(pd.DataFrame(pairs, columns=['value', 'other_value', 'distance_m']).round(1),
+                         hide_index=True, use_container_width=True)
+        else:
+            st.success(f"No two values were captured within {DUPLICATE_RADIUS_M} m of each other.")
+
+# Check whether both location and image are captured for a value
+def is_value_complete(value):
+    progress = st.session_state.progress.get(value, {})
+    return progress.get('location', False) and progress.get('image', False)
+
+# Render page controls for a view and return the slice of values to show
+def render_pagination(view, total):
+    page_size = st.session_state.page_size
+    page_count = max(1, math.ceil(total / page_size))
+    page = min(st.session_state.page.get(view, 0), page_count - 1)
+    
+    if total > min(PAGE_SIZE_OPTIONS):
+        col1, col2, col3, col4 = st.columns([1, 2, 1, 2])
+        with col1:
+            if st.button("◀ Prev", key=f"{view}_prev_page", disabled=page == 0):
+                st.session_state.page[view] = page - 1
+                rerun_fragment()
+        with col2:
+            st.write(f"Page {page + 1} of {page_count} ({total} values)")
+        with col3:
+            if st.button("Next ▶", key=f"{view}_next_page", disabled=page >= page_count - 1):
+                st.session_state.page[view] = page + 1
+                rerun_fragment()
+        with col4:
+            page_size_choice = st.selectbox(
+                "Values per page", PAGE_SIZE_OPTIONS,
+                index=PAGE_SIZE_OPTIONS.index(page_size), key="page_size_select"
+            )
+            if page_size_choice != page_size:
+                # Keep the first visible value on screen after resizing
+                st.session_state.page_size = page_size_choice
+                st.session_state.page = {view: page * page_size // page_size_choice}
+                rerun_fragment()
+    
+    start = page * page_size
+    return start, min(start + page_size, total)
+
+# Render the expander for a single value
+def render_value_expander(value, label, prefix):
+    location_done = st.session_state.progress.get(value, {}).get('location', False)
+    image_done = st.session_state.progress.get(value, {}).get('image', False)
+    
+    # Determine if this expander should be expanded
+    is_expanded = value in st.session_state.open_expanders
+    
+    with st.expander(label, expanded=is_expanded):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            loc_status = "✅" if location_done else "❌"
+            st.write(f"Location: {loc_status}")
+            
+            # Only show location button if location not captured yet
+            if not location_done:
+                get_and_save_location(value, prefix=prefix)
+            else:
+                # Show saved location
+                location = get_value_location(value)
+                if location is not None:
+                    st.write(f"Saved location: {format_location(location)}")
+        
+        with col2:
+            img_status = "✅" if image_done else "❌"
+            st.write(f"Image: {img_status}")
+            
+            # Only show camera button if image not captured yet
+            if value in st.session_state.pending_images:
+                st.write("⏳ Processing photo...")
+            elif not image_done:
+                if st.button(f"📸 Take Photo", key=f"{prefix}_activate_{value}"):
+                    st.session_state.active_capture_value = value
+                    st.session_state.temp_photo = None
+                    st.session_state.open_expanders.add(value)
+                    st.rerun()
+            else:
+                # Show saved image
+                display_image(get_value_field(value, st.session_state.image_column), key=f"{prefix}_{value}")
+
+# Render the selected view's page of values and the progress header
+@st.fragment
+@instrumented()
+def render_values_page(filtered_values):
+    """Saves and page changes rerun only this fragment, not the whole enrichment screen"""
+    # Display values to enrich
+    st.write("## Values to enrich")
+    
+    # Only the selected view is built, rather than every tab on every rerun
+    view = st.radio("View", VIEW_OPTIONS, horizontal=True, key="active_view", label_visibility="collapsed")
+    
+    stats = get_progress_stats()
+    if view == "Nearby":
+        # The nearby view renders its own results rather than value pages
+        render_nearby_view(filtered_values)
+        view_values = []
+        prefix = "near"
+    elif view == "In Progress":
+        if st.session_state.search_term:
+            view_values = [v for v in filtered_values if v in stats['in_progress']]
+        else:
+            view_values = stats['in_progress']
+        prefix = "ip"
+        if not view_values:
+            if st.session_state.search_term:
+                st.info(f"No in-progress values match your search: '{st.session_state.search_term}'")
+            else:
+                st.info("No values in progress - all are completed!")
+    elif view == "Completed":
+        if st.session_state.search_term:
+            view_values = [v for v in filtered_values if v not in stats['in_progress']]
+        else:
+            view_values = stats['completed_positions']
+        prefix = "done"
+        if not view_values:
+            if st.session_state.search_term:
+                st.info(f"No completed values match your search: '{st.session_state.search_term}'")
+            else:
+                st.info("No completed values yet!")
+    else:
+        view_values = filtered_values
+        prefix = "all"
+        if not view_values:
+            st.info(f"No values match your search: '{st.session_state.search_term}'")
+    
+    # Render only the current page of this view
+    start, end = render_pagination(view, len(view_values))
+    page_values = list(itertools.islice(view_values, start, end))
+    if view == "Completed" and not st.session_state.search_term:
+        page_values = [stats['values'][i] for i in page_values]
+    for value in page_values:
+        if view == "All Values":
+            label = f"{value} {'✅' if is_value_complete(value) else '🔄'}"
+        elif view == "Completed":
+            label = f"{value} ✅"
+        else:
+            label = f"{value}"
+        render_value_expander(value, label, prefix)
+    
+    # Display progress stats
+    total = len(stats['values'])
+    completed_count = len(stats['completed_positions'])
+    
+    progress_pct = int(completed_count/total*100) if total else 0
+    st.write(f"## Progress: {completed_count}/{total} values completed ({progress_pct}%)")
+
+# Function to estimate a percentile from a timing histogram
+def estimate_percentile_ms(stats, q):
+    """Return the upper edge of the bucket holding the q quantile, or the max for the last bucket"""
+    target = q * stats['count']
+    for i, count in enumerate(itertools.accumulate(stats['buckets'])):
+        if count >= target:
+            return TIMING_BUCKETS_MS[i] if i < len(TIMING_BUCKETS_MS) else stats['max'] * 1000
+    return stats['max'] * 1000
+
+# Render the opt-in timing panel in the sidebar
+def render_debug_panel():
+    timings = st.session_state.timings
+    with st.sidebar:
+        st.header("⏱ Timings")
+        st.caption("Per-session timings up to the previous rerun. Remove ?debug=1 from the address to hide this panel.")
+        if not timings['stats']:
+            st.write("No timings recorded yet.")
+            return
+        
+        st.dataframe(pd.DataFrame([
+            {
+                'name': name,
+                'calls': stats['count'],
+                'mean_ms': round(stats['total'] / stats['count'] * 1000, 2),
+                'p95_ms': round(estimate_percentile_ms(stats, 0.95), 2),
+                'max_ms': round(stats['max'] * 1000, 2),
+                'mean_kb': round(stats['payload_bytes'] / stats['count'] / 1024, 1) if stats['payload_bytes'] else None
+            }
+            for name, stats in sorted(timings['stats'].items())
+        ]), hide_index=True, use_container_width=True)
+        
+        name = st.selectbox("Histogram", sorted(timings['stats']), key="debug_histogram")
+        labels = [f"≤{edge} ms" for edge in TIMING_BUCKETS_MS] + [f">{TIMING_BUCKETS_MS[-1]} ms"]
+        st.bar_chart(pd.DataFrame({'duration': labels, 'calls': timings['stats'][name]['buckets']}),
+                     x='duration', y='calls', sort=False)
+        
+        st.download_button(
+            "Export samples (JSON lines)",
+            "".join(json.dumps(sample) + "\n" for sample in timings['samples']),
+            file_name=f"timings_{st.session_state.session_id}.jsonl",
+            mime="application/x-ndjson", on_click="ignore"
+        )
+        if st.button("Reset timings"):
+            st.session_state.timings = {'stats': {}, 'samples': deque(maxlen=TIMING_SAMPLE_LIMIT)}
+            st.rerun()
+
+# Render the sidebar switcher between enrichment targets
+def render_target_switcher():
+    target_ids = list(get_targets())
+    # Numbered labels stay unique when two targets share a dataset and column
+    labels = [f"{number}. {get_target_label(target_id)}" for number, target_id in enumerate(target_ids, 1)]
+    with st.sidebar:
+        st.subheader("🗂️ Datasets and columns")
+        label = st.selectbox(
+            "Enriching", labels, index=target_ids.index(st.session_state.active_target),
+            label_visibility="collapsed"
+        )
+        selected = target_ids[labels.index(label)]
+        if selected != st.session_state.active_target:
+            switch_target(selected)
+            st.rerun()
+        
+        if st.button("➕ New dataset", use_container_width=True):
+            add_target()
+            st.rerun()
+        if st.button("➕ Another column of this dataset", use_container_width=True,
+                     disabled=st.session_state.selected_column is None):
+            add_target(same_dataset=True)
+            st.rerun()
+
 # Add script to handle scroll position
 def add_scroll_management_script():
     st.components.v1.html("""
@@ -425,6 +2469,10 @@ def add_scroll_management_script():
 
 # Main app
 def main():
+    if st.session_state.timings_enabled:
+        render_debug_panel()
+    
+    mark_phase("page setup")
     st.title("Data Enrichment with Location and Images")
     
     # Add scroll position management
@@ -446,7 +2494,12 @@ def main():
     </script>
     """, height=0)
     
+    # Several datasets and columns can be enriched side by side
+    mark_phase("target switcher")
+    render_target_switcher()
+    
     # Step 1: Check for saved state when the app starts
+    mark_phase("restore prompt")
     if st.session_state.data is None:
         # Check if there's a saved state available
         if saved_state_exists():
@@ -456,6 +2509,21 @@ def main():
                 if timestamp:
                     st.info(f"Found saved session from {timestamp}. Would you like to restore it?")
                     
+                    # Summarize the saved progress from the metadata sidecar alone
+                    metadata = get_saved_state_metadata()
+                    # Large file mode only knows the row count once a column has been scanned
+                    row_count = metadata.get('row_count') if metadata else None
+                    if metadata and metadata.get('selected_column'):
+                        st.write(
+                            f"Column **{metadata['selected_column']}**: "
+                            f"{metadata['completed_count']}/{metadata['value_count']} values completed "
+                            f"({metadata['location_count']} locations, {metadata['image_count']} photos)"
+                            + (f" across {row_count} rows" if row_count is not None else "")
+                        )
+                    elif metadata:
+                        st.write(f"{row_count} rows uploaded, no column selected yet" if row_count is not None
+                                 else "File uploaded, no column selected yet")
+                    
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.button("Yes, restore session"):
@@ -472,18 +2540,32 @@ def main():
                 st.error(f"Error checking saved state: {e}")
     
     # Step 1: Upload CSV file (modified to save state)
+    mark_phase("upload")
     if st.session_state.data is None:
+        large_file_mode = st.checkbox(
+            "Large file mode",
+            help="Read the CSV in chunks, keep only the selected column in memory and merge enrichment back on download"
+        )
         uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
         
         if uploaded_file:
             try:
-                st.session_state.data = pd.read_csv(uploaded_file)
+                if large_file_mode:
+                    # Keep the file on disk and only load a preview for column selection
+                    st.session_state.source_path = save_uploaded_source(uploaded_file)
+                    st.session_state.data_fingerprint = os.path.splitext(os.path.basename(st.session_state.source_path))[0]
+                    st.session_state.data = pd.read_csv(st.session_state.source_path, nrows=PREVIEW_ROWS)
+                else:
+                    st.session_state.data = pd.read_csv(uploaded_file)
+                    st.session_state.data_fingerprint = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+                st.session_state.data_name = uploaded_file.name
                 st.success("CSV file uploaded successfully!")
                 save_app_state()  # Save state after CSV is loaded
             except Exception as e:
                 st.error(f"Error: {e}")
     
     # Step 2: Column selection (modified to save state)
+    mark_phase("column selection")
     if st.session_state.data is not None:
         if st.session_state.selected_column is None:
             st.write("Preview of your data:")
@@ -495,14 +2577,23 @@ def main():
             if st.button("Confirm Column"):
                 st.session_state.selected_column = selected_column
                 
-                # Initialize progress tracking for each value
-                unique_values = st.session_state.data[st.session_state.selected_column].astype(str).unique()
+                if st.session_state.source_path is not None:
+                    # Large file mode: scan just this column of the file on disk
+                    with st.spinner("Reading values from file..."):
+                        st.session_state.data, st.session_state.source_row_count = load_source_values(
+                            st.session_state.source_path, selected_column
+                        )
                 
+                # Index the row positions of each value for fast lookups
+                unique_values = build_value_index()['values']
+                
+                # Initialize progress tracking for each value
                 for value in unique_values:
                     if value not in st.session_state.progress:
                         st.session_state.progress[value] = {'location': False, 'image': False}
                     if value not in st.session_state.camera_active:
                         st.session_state.camera_active[value] = False
+                rebuild_progress_stats()
                 
                 save_app_state()  # Save state after column selection
                 st.rerun()
@@ -510,8 +2601,15 @@ def main():
         # Step 3: Enrich each value
         if st.session_state.selected_column is not None:
             
+            # Pick up photos the background encoder has finished
+            mark_phase("pending photos")
+            collect_pending_images()
+            if st.session_state.pending_images:
+                watch_pending_images()
+            
             # Handle active image capture session
             if st.session_state.active_capture_value is not None:
+                mark_phase("capture screen")
                 value = st.session_state.active_capture_value
                 st.subheader(f"Taking Photo for: {value}")
                 
@@ -527,11 +2625,27 @@ def main():
                     # Add some space around the camera component
                     st.markdown('<div style="padding:5px 0;"></div>', unsafe_allow_html=True)
                     
-                    # Use custom component directly with minimal parameters
-                    photo = back_camera_input("", key=f"cam_{value}")
-                    
-                    # Add tap to capture text
-                    st.markdown('<div class="camera-prompt">👆 Tap to capture</div>', unsafe_allow_html=True)
+                    # Resizing in the browser uploads an 800px JPEG instead of the full camera frame
+                    browser_resize = st.toggle("Resize photos on this device", key="browser_resize",
+                                               help="Uses the phone's camera app and uploads a small JPEG")
+                    if browser_resize:
+                        photo = None
+                        # Upload at the profile's size, and at its quality when nothing will re-encode it
+                        profile = get_image_profile()
+                        passes_through = profile['format'] == 'JPEG' and 'target_bytes' not in profile
+                        browser_photo = browser_camera_input(
+                            key=f"browser_cam_{value}_{st.session_state.capture_round}",
+                            max_size=profile['max_size'],
+                            quality=profile['quality'] if passes_through else BROWSER_UPLOAD_QUALITY
+                        )
+                        if browser_photo is not None and browser_photo != st.session_state.temp_photo:
+                            st.session_state.temp_photo = browser_photo
+                    else:
+                        # Use custom component directly with minimal parameters
+                        photo = back_camera_input("", key=f"cam_{value}")
+                        
+                        # Add tap to capture text
+                        st.markdown('<div class="camera-prompt">👆 Tap to capture</div>', unsafe_allow_html=True)
                     
                     # Cancel button
                     if st.button("❌ Cancel", key=f"cam_cancel_{value}"):
@@ -549,9 +2663,8 @@ def main():
                             # Store the photo temporarily for preview
                             st.session_state.temp_photo = photo.getvalue()
                             
-                            # Display preview with container width
-                            img = Image.open(BytesIO(st.session_state.temp_photo))
-                            st.image(img, use_container_width=True, caption="Current capture")
+                            # Display the cached downscaled preview with container width
+                            st.image(get_capture_preview(st.session_state.temp_photo), use_container_width=True, caption="Current capture")
                             
                             # Add save button
                             if st.button("✅ Save & Continue", key="save_photo"):
@@ -566,14 +2679,14 @@ def main():
                             # Add retake button
                             if st.button("🔄 Retake", key="retake_photo"):
                                 st.session_state.temp_photo = None
+                                st.session_state.capture_round += 1
                                 st.rerun()
                                 
                         except Exception as e:
                             st.error(f"Error processing photo: {e}")
                     elif st.session_state.temp_photo is not None:
-                        # Display previously captured photo with container width
-                        img = Image.open(BytesIO(st.session_state.temp_photo))
-                        st.image(img, use_container_width=True, caption="Current capture")
+                        # Display previously captured photo from the cached preview
+                        st.image(get_capture_preview(st.session_state.temp_photo), use_container_width=True, caption="Current capture")
                         
                         # Add save button
                         if st.button("✅ Save & Continue", key="save_photo_existing"):
@@ -588,6 +2701,7 @@ def main():
                         # Add retake button
                         if st.button("🔄 Retake", key="retake_photo_existing"):
                             st.session_state.temp_photo = None
+                            st.session_state.capture_round += 1
                             st.rerun()
                     else:
                         st.write("No photo captured yet. Tap on the camera to take a picture.")
@@ -597,190 +2711,99 @@ def main():
                 
             # Main enrichment UI
             st.write(f"Enriching data for column: **{st.session_state.selected_column}**")
+            st.caption("Progress is saved to this page's address - bookmark it to resume this session later.")
             
-            # Convert to strings to avoid numpy array issues
-            unique_values = st.session_state.data[st.session_state.selected_column].astype(str).unique().tolist()
+            # Photos for this dataset are stored with the chosen encoding profile
+            profile_names = get_available_image_profiles()
+            current_profile = st.session_state.image_profile
+            image_profile = st.selectbox(
+                "📷 Photo encoding", profile_names,
+                index=profile_names.index(current_profile) if current_profile in profile_names else 0,
+                format_func=lambda name: IMAGE_PROFILES[name]['label']
+            )
+            if image_profile != st.session_state.image_profile:
+                st.session_state.image_profile = image_profile
+                save_app_state()
             
             # Search and filter functionality
+            mark_phase("search")
             search_term = st.text_input("🔍 Search values:", value=st.session_state.search_term)
             if search_term != st.session_state.search_term:
                 st.session_state.search_term = search_term
+                st.session_state.page = {}
                 st.rerun()
                 
             # Filter values based on search
-            filtered_values = filter_values(unique_values, st.session_state.search_term)
+            unique_values = get_progress_stats()['values']
+            if st.session_state.search_term:
+                filtered_values, match_count = filter_values(get_search_index(), st.session_state.search_term)
+            else:
+                # The search index is only built once something is searched for
+                filtered_values, match_count = unique_values, len(unique_values)
             
-            if st.session_state.search_term and len(filtered_values) < len(unique_values):
-                st.write(f"Showing {len(filtered_values)} of {len(unique_values)} values")
+            if st.session_state.search_term and match_count < len(unique_values):
+                st.write(f"Showing {match_count} of {len(unique_values)} values")
+            if len(filtered_values) < match_count:
+                st.write(f"Listing the best {len(filtered_values)} matches - refine your search to see others")
                 
-            # Display values to enrich
-            st.write("## Values to enrich")
+            # Batch mode applies a single location fix to many values at the same site
+            mark_phase("batch location")
+            if st.toggle("📍 Batch location mode", key="batch_location_mode"):
+                candidates = itertools.islice(
+                    (v for v in filtered_values if not st.session_state.progress.get(v, {}).get('location', False)),
+                    SEARCH_RESULT_LIMIT
+                )
+                render_batch_location(list(candidates))
             
-            # Create tabs for "In Progress" and "Completed"
-            in_progress_tab, completed_tab, all_tab = st.tabs(["In Progress", "Completed", "All Values"])
+            # Offline mode queues captures in the browser and syncs them in batches
+            if st.toggle("📴 Offline capture queue", key="offline_queue_mode"):
+                candidates = itertools.islice(
+                    (v for v in filtered_values if not is_value_complete(v)), SEARCH_RESULT_LIMIT
+                )
+                render_offline_queue(list(candidates))
             
-            # Helper functions for grouping values
-            def get_in_progress_values():
-                return [v for v in filtered_values if not (
-                    st.session_state.progress.get(v, {}).get('location', False) and 
-                    st.session_state.progress.get(v, {}).get('image', False)
-                )]
-                
-            def get_completed_values():
-                return [v for v in filtered_values if (
-                    st.session_state.progress.get(v, {}).get('location', False) and 
-                    st.session_state.progress.get(v, {}).get('image', False)
-                )]
-            
-            # In Progress Tab
-            with in_progress_tab:
-                in_progress_values = get_in_progress_values()
-                if in_progress_values:
-                    for value in in_progress_values:
-                        # Determine if this expander should be expanded
-                        is_expanded = value in st.session_state.open_expanders
-                        
-                        with st.expander(f"{value}", expanded=is_expanded):
-                            col1, col2 = st.columns(2)
-                            
-                            with col1:
-                                # Get current location status for this value
-                                location_done = st.session_state.progress.get(value, {}).get('location', False)
-                                loc_status = "✅" if location_done else "❌"
-                                st.write(f"Location: {loc_status}")
-                                
-                                # Only show location button if location not captured yet
-                                if not location_done:
-                                    get_and_save_location(value, prefix="ip")
-                                else:
-                                    # Show saved location
-                                    row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == value].index[0]
-                                    loc_col = st.session_state.location_column
-                                    if loc_col and loc_col in st.session_state.data.columns:
-                                        loc_data = st.session_state.data.loc[row_idx, loc_col]
-                                        st.write(f"Saved location: {loc_data}")
-                            
-                            with col2:
-                                img_status = "✅" if st.session_state.progress.get(value, {}).get('image', False) else "❌"
-                                st.write(f"Image: {img_status}")
-                                
-                                # Only show camera button if image not captured yet
-                                if not st.session_state.progress.get(value, {}).get('image', False):
-                                    if st.button(f"📸 Take Photo", key=f"ip_activate_{value}"):
-                                        st.session_state.active_capture_value = value
-                                        st.session_state.temp_photo = None
-                                        st.session_state.open_expanders.add(value)
-                                        st.rerun()
-                                else:
-                                    # Show saved image
-                                    row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == value].index[0]
-                                    img_col = st.session_state.image_column
-                                    if img_col and img_col in st.session_state.data.columns:
-                                        base64_image = st.session_state.data.loc[row_idx, img_col]
-                                        display_image_from_base64(base64_image)
-                else:
-                    if st.session_state.search_term:
-                        st.info(f"No in-progress values match your search: '{st.session_state.search_term}'")
-                    else:
-                        st.info("No values in progress - all are completed!")
-                
-            # Completed Tab
-            with completed_tab:
-                completed_values = get_completed_values()
-                if completed_values:
-                    for value in completed_values:
-                        with st.expander(f"{value} ✅"):
-                            col1, col2 = st.columns(2)
-                            
-                            with col1:
-                                st.write("Location: ✅")
-                                row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == value].index[0]
-                                loc_col = st.session_state.location_column
-                                if loc_col and loc_col in st.session_state.data.columns:
-                                    loc_data = st.session_state.data.loc[row_idx, loc_col]
-                                    st.write(f"Saved location: {loc_data}")
-                            
-                            with col2:
-                                st.write("Image: ✅")
-                                row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == value].index[0]
-                                img_col = st.session_state.image_column
-                                if img_col and img_col in st.session_state.data.columns:
-                                    base64_image = st.session_state.data.loc[row_idx, img_col]
-                                    display_image_from_base64(base64_image)
-                else:
-                    if st.session_state.search_term:
-                        st.info(f"No completed values match your search: '{st.session_state.search_term}'")
-                    else:
-                        st.info("No completed values yet!")
-                
-            # All Values Tab
-            with all_tab:
-                if len(filtered_values) > 0:
-                    for value in filtered_values:
-                        location_done = st.session_state.progress.get(value, {}).get('location', False)
-                        image_done = st.session_state.progress.get(value, {}).get('image', False)
-                        status = "✅" if location_done and image_done else "🔄"
-                        
-                        # Determine if this expander should be expanded
-                        is_expanded = value in st.session_state.open_expanders
-                        
-                        with st.expander(f"{value} {status}", expanded=is_expanded):
-                            col1, col2 = st.columns(2)
-                            
-                            with col1:
-                                loc_status = "✅" if location_done else "❌"
-                                st.write(f"Location: {loc_status}")
-                                
-                                if not location_done:
-                                    # Use a different prefix for all_tab to create unique keys
-                                    get_and_save_location(value, prefix="all")
-                                else:
-                                    row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == value].index[0]
-                                    loc_col = st.session_state.location_column
-                                    if loc_col and loc_col in st.session_state.data.columns:
-                                        loc_data = st.session_state.data.loc[row_idx, loc_col]
-                                        st.write(f"Saved location: {loc_data}")
-                            
-                            with col2:
-                                img_status = "✅" if image_done else "❌"
-                                st.write(f"Image: {img_status}")
-                                
-                                if not image_done:
-                                    if st.button(f"📸 Take Photo", key=f"all_activate_{value}"):
-                                        st.session_state.active_capture_value = value
-                                        st.session_state.temp_photo = None
-                                        st.session_state.open_expanders.add(value)
-                                        st.rerun()
-                                else:
-                                    row_idx = st.session_state.data[st.session_state.data[st.session_state.selected_column].astype(str) == value].index[0]
-                                    img_col = st.session_state.image_column
-                                    if img_col and img_col in st.session_state.data.columns:
-                                        base64_image = st.session_state.data.loc[row_idx, img_col]
-                                        display_image_from_base64(base64_image)
-                else:
-                    st.info(f"No values match your search: '{st.session_state.search_term}'")
-            
-            # Display progress stats
-            total = len(unique_values)
-            completed_count = len([v for v in unique_values if (
-                st.session_state.progress.get(v, {}).get('location', False) and 
-                st.session_state.progress.get(v, {}).get('image', False)
-            )])
-            
-            progress_pct = int(completed_count/total*100) if total else 0
-            st.write(f"## Progress: {completed_count}/{total} values completed ({progress_pct}%)")
+            # Display values to enrich and the progress header
+            mark_phase("values page")
+            render_values_page(filtered_values)
             
             # Download section
+            mark_phase("download")
             st.write("## Download Enriched Data")
             st.write("When you are finished, you can download the enriched data.")
             
             if st.button("Prepare Download"):
-                st.markdown(get_csv_download_link(st.session_state.data), unsafe_allow_html=True)
+                try:
+                    # Static serving streams the file from disk; otherwise it is read only once clicked
+                    static_serving = st.get_option("server.enableStaticServing")
+                    export_dir = STATIC_EXPORT_DIR if static_serving else EXPORT_DIR
+                    os.makedirs(export_dir, exist_ok=True)
+                    remove_stale_exports(export_dir)
+                    export_path = export_enriched_csv(
+                        st.session_state.data, st.session_state.image_column,
+                        source_path=st.session_state.source_path,
+                        key_column=st.session_state.selected_column,
+                        enrichment_columns=get_enrichment_columns(),
+                        directory=export_dir
+                    )
+                    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    render_export_download(export_path, f"enriched_data_{stamp}.csv", "Download Enriched CSV",
+                                           "text/csv", static_serving)
+                    photos_path = export_images_zip(st.session_state.data, st.session_state.image_column,
+                                                    directory=export_dir)
+                    if photos_path:
+                        render_export_download(photos_path, f"enriched_data_{stamp}_photos.zip", "Download Photos",
+                                               "application/zip", static_serving)
+                        st.caption(f"The CSV's {st.session_state.image_column} column names each photo's file in the zip.")
+                    st.caption(f"The download link expires after {EXPORT_MAX_AGE_SECONDS // 60} minutes.")
+                except Exception as e:
+                    st.error(f"Error preparing download: {e}")
                 
             # Option to start over (modified to clear localStorage)
             if st.button("Start Over (Clear Session)"):
-                # Clear the saved state file
-                clear_saved_state()
+                # Clear the saved state of every target
+                for target_id in get_targets():
+                    clear_saved_state(target_id)
+                st.query_params.pop("target", None)
                 # Clear the session state
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
@@ -794,4 +2817,8 @@ def main():
 
 # Run the app
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Close the last phase even when main() stops early for a rerun
+        mark_phase()
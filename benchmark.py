@@ -0,0 +1,209 @@
+"""Headless benchmarks for the enrichment hot paths.
+
+Runs against synthetic CSVs and camera-sized JPEGs without a browser or network
+and writes the timings as JSON, so runs can be compared to spot regressions:
+
+    python benchmark.py --sizes 1000 10000 100000 --output benchmark_results.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import PIL
+from PIL import Image
+
+# Bare-mode session state works but warns on every access, so quieten Streamlit before importing it
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+DEFAULT_SIZES = [1000, 10000, 100000]
+ROWS_PER_VALUE = 4
+CAMERA_SIZE = (4032, 3024)
+SEARCH_TERMS = ["1", "SITE-00", "SITE-0001", "zz"]
+IMAGE_TIMEOUT_SECONDS = 60
+
+# Function to time repeated calls of fn
+def time_call(fn, repeat):
+    """Return min/median/mean seconds over repeat calls of fn"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'repeat': repeat
+    }
+
+# Function to make a synthetic CSV with ROWS_PER_VALUE rows per site value
+def make_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.permutation(np.arange(rows) % max(1, rows // ROWS_PER_VALUE))
+    pd.DataFrame({
+        'site': [f"SITE-{v:06d}" for v in values],
+        'reading': rng.normal(size=rows).round(3),
+        'note': rng.choice(["north gate", "river bank", "field", "depot"], size=rows)
+    }).to_csv(path, index=False)
+    return path
+
+# Function to make a synthetic camera JPEG
+def make_camera_jpeg(size=CAMERA_SIZE, seed=0):
+    """A smooth gradient with sensor-like noise, so it compresses like a real photo"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    base = np.stack([x * 255 // size[0], y * 255 // size[1], (x + y) * 255 // (size[0] + size[1])], axis=-1)
+    noisy = np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(noisy).save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+# Function to load the app module with a fresh session
+def load_app_session(csv_path):
+    """Reimport app so its session state initialisation runs again, then confirm the site column"""
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    app = importlib.reload(sys.modules['app']) if 'app' in sys.modules else importlib.import_module('app')
+
+    st.session_state.data = pd.read_csv(csv_path)
+    st.session_state.selected_column = 'site'
+    for value in app.build_value_index()['values']:
+        st.session_state.progress[value] = {'location': False, 'image': False}
+    app.rebuild_progress_stats()
+    return app
+
+# Function to wait until the background encoder has stored every pending photo
+def wait_for_images(app):
+    deadline = time.monotonic() + IMAGE_TIMEOUT_SECONDS
+    while st.session_state.pending_images:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Background image encoding did not finish")
+        app.collect_pending_images()
+        time.sleep(0.01)
+
+# Function to benchmark the helper functions for one dataset size
+def bench_helpers(csv_path, photo, repeat):
+    app = load_app_session(csv_path)
+    values = app.get_progress_stats()['values']
+    rng = np.random.default_rng(1)
+    results = {}
+
+    results['compress_and_encode_image'] = time_call(lambda: app.compress_and_encode_image(photo), repeat)
+    for name in app.get_available_image_profiles():
+        profile = app.IMAGE_PROFILES[name]
+        results[f"encode_image[{name}]"] = time_call(lambda: app.encode_image(photo, profile), repeat)
+        results[f"encode_image[{name}]"]['output_bytes'] = len(app.encode_image(photo, profile))
+
+    targets = iter(values)
+    results['save_location'] = time_call(
+        lambda: app.save_location(next(targets), rng.uniform(-60, 60), rng.uniform(-180, 180), 10.0), repeat
+    )
+
+    # Submitting returns once the photo is queued; end to end waits for it to be stored
+    results['save_image_submit'] = time_call(lambda: app.save_image(next(targets), photo), repeat)
+    wait_for_images(app)
+
+    def save_image_end_to_end():
+        app.save_image(next(targets), photo)
+        wait_for_images(app)
+    results['save_image_end_to_end'] = time_call(save_image_end_to_end, repeat)
+
+    results['save_app_state'] = time_call(app.save_app_state, repeat)
+    results['load_app_state'] = time_call(app.load_app_state, repeat)
+
+    app.get_search_index()
+    for term in SEARCH_TERMS:
+        results[f"filter_values[{term}]"] = time_call(lambda: app.filter_values(app.get_search_index(), term), repeat)
+
+    def export():
+        os.remove(app.export_enriched_csv(
+            st.session_state.data, st.session_state.image_column,
+            key_column=st.session_state.selected_column,
+            enrichment_columns=app.get_enrichment_columns()
+        ))
+    results['export_enriched_csv'] = time_call(export, repeat)
+
+    def export_photos():
+        photos_path = app.export_images_zip(st.session_state.data, st.session_state.image_column)
+        if photos_path:
+            os.remove(photos_path)
+    results['export_images_zip'] = time_call(export_photos, repeat)
+
+    app.clear_saved_state()
+    return results
+
+# Function to benchmark full script reruns of the enrichment screen
+def bench_main_rerun(csv_path, repeat):
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.run()
+    at.session_state['data'] = pd.read_csv(csv_path)
+    at.run()
+    at.selectbox[0].select('site')
+    [button for button in at.button if button.label == "Confirm Column"][0].click()
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return {'main_rerun': time_call(at.run, repeat)}
+
+# Function to describe the environment the benchmarks ran in
+def get_environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'streamlit': st.__version__,
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pillow': PIL.__version__
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the enrichment hot paths headlessly")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="CSV row counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per measurement")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--skip-rerun", action="store_true", help="Skip the AppTest main() rerun benchmark")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'environment': get_environment(),
+        'results': {}
+    }
+    photo = make_camera_jpeg()
+    report['photo_bytes'] = len(photo)
+
+    # The app keeps sessions, uploads and images relative to the working directory
+    with tempfile.TemporaryDirectory(prefix="enrichment_bench_") as workdir:
+        os.chdir(workdir)
+        for rows in args.sizes:
+            print(f"Benchmarking {rows} rows...", flush=True)
+            csv_path = make_csv(os.path.join(workdir, f"data_{rows}.csv"), rows)
+            results = bench_helpers(csv_path, photo, args.repeat)
+            if not args.skip_rerun:
+                results.update(bench_main_rerun(csv_path, args.repeat))
+            report['results'][str(rows)] = results
+            for name, timing in results.items():
+                print(f"  {name:32s} median {timing['median'] * 1000:10.2f} ms")
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()